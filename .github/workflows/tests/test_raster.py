@@ -1,8 +1,22 @@
 """test veda-backend.raster."""
 
+import subprocess
+from urllib.parse import parse_qs, urlparse
+
 import httpx
 
 raster_endpoint = "http://0.0.0.0:8082"
+raster_container = "veda.raster"
+
+
+def register_mosaic():
+    """Register the mosaic of the test collection, returns its search id."""
+    resp = httpx.post(
+        f"{raster_endpoint}/mosaic/register",
+        json={"collections": ["noaa-emergency-response"], "filter-lang": "cql-json"},
+    )
+    assert resp.status_code == 200
+    return resp.json()["searchid"]
 
 
 def test_raster_api():
@@ -195,3 +209,112 @@ def test_item():
     assert "item=20200307aC0853300w361200" in resp.json()["tiles"][0]
     assert "collection=noaa-emergency-response" in resp.json()["tiles"][0]
     assert resp.json()["bounds"] == [-85.5501, 36.1749, -85.5249, 36.2001]
+
+
+def test_tilejson_versions():
+    """test the content version of the tile URLs."""
+    searchid = register_mosaic()
+    resp = httpx.get(
+        f"{raster_endpoint}/mosaic/{searchid}/tilejson.json",
+        params={"assets": "cog"},
+    )
+    assert resp.status_code == 200
+    tile_url = urlparse(resp.json()["tiles"][0])
+    version = parse_qs(tile_url.query)["v"][0]
+    assert version
+
+    resp = httpx.get(
+        f"{raster_endpoint}/stac/tilejson.json",
+        params={
+            "collection": "noaa-emergency-response",
+            "item": "20200307aC0853300w361200",
+            "assets": "cog",
+        },
+    )
+    assert resp.status_code == 200
+    assert parse_qs(urlparse(resp.json()["tiles"][0]).query)["v"][0]
+
+    # The tiles of the current version are immutable, not the ones of a stale one
+    tile = f"{raster_endpoint}/mosaic/{searchid}/tiles/15/8589/12849"
+    resp = httpx.get(tile, params={"assets": "cog", "v": version}, timeout=10.0)
+    assert resp.status_code == 200
+    assert "immutable" in resp.headers["cache-control"]
+
+    resp = httpx.get(tile, params={"assets": "cog", "v": "stale"}, timeout=10.0)
+    assert resp.status_code == 200
+    assert "immutable" not in resp.headers.get("cache-control", "")
+
+
+def test_seeded_tiles():
+    """test the tiles served from the tile store."""
+    searchid = register_mosaic()
+    tile = f"{raster_endpoint}/mosaic/{searchid}/tiles/WebMercatorQuad/15/8589/12849"
+    resp = httpx.get(tile, params={"assets": "cog"}, timeout=10.0)
+    assert resp.status_code == 200
+    assert "x-tile-cache" not in resp.headers
+
+    # Seeds the tile of the point, within the API container and its tile store
+    subprocess.run(
+        [
+            "docker",
+            "exec",
+            raster_container,
+            "python",
+            "-m",
+            "src.seed",
+            f"--searchid={searchid}",
+            "--bbox=-85.6358,36.1624,-85.6357,36.1625",
+            "--zooms=15-15",
+            "--param=assets=cog",
+            "--processes=1",
+        ],
+        check=True,
+        timeout=120,
+    )
+
+    resp = httpx.get(tile, params={"assets": "cog"}, timeout=10.0)
+    assert resp.status_code == 200
+    assert resp.headers["x-tile-cache"] == "hit"
+    assert resp.headers["content-type"] == "image/jpeg"
+
+    # Other render parameters were not seeded
+    resp = httpx.get(tile, params={"assets": "cog", "rescale": "0,100"}, timeout=10.0)
+    assert resp.status_code == 200
+    assert "x-tile-cache" not in resp.headers
+
+
+def test_cog_audit():
+    """test the COG layout audit."""
+    resp = httpx.get(f"{raster_endpoint}/cog/audit")
+    assert resp.status_code == 400
+
+    resp = httpx.get(f"{raster_endpoint}/cog/audit", params={"searchid": "missing"})
+    assert resp.status_code == 404
+
+    params = {"collection": "noaa-emergency-response", "limit": 1}
+    resp = httpx.get(f"{raster_endpoint}/cog/audit", params=params, timeout=30.0)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["summary"]["assets"] == len(body["assets"]) == 1
+    asset = body["assets"][0]
+    assert asset["asset"] == "cog"
+    assert asset["width"] and asset["block_size"]
+    assert isinstance(asset["problems"], list)
+
+    resp = httpx.get(
+        f"{raster_endpoint}/cog/audit", params={**params, "f": "csv"}, timeout=30.0
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/csv")
+    header, row = resp.text.splitlines()[:2]
+    assert header.startswith("item,asset,href,valid")
+    assert ",cog," in row
+
+
+def test_statement_timeout():
+    """test the queries cancelled by their statement timeout."""
+    searchid = register_mosaic()
+    resp = httpx.get(
+        f"{raster_endpoint}/mosaic/{searchid}/tiles/WebMercatorQuad/15/8589/12849/assets"
+    )
+    assert resp.status_code == 504
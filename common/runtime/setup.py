@@ -0,0 +1,20 @@
+"""Setup veda.common."""
+
+from setuptools import find_namespace_packages, setup
+
+inst_reqs = [
+    "starlette",
+    "orjson",
+    "starlette-cramjam>=0.3,<0.4",
+    "aws-lambda-powertools>=1.18.0",
+]
+
+setup(
+    name="veda.common",
+    version="0.1.0",
+    description="Middlewares shared by the VEDA APIs",
+    python_requires=">=3.8",
+    packages=find_namespace_packages(exclude=["tests*"]),
+    zip_safe=False,
+    install_requires=inst_reqs,
+)
@@ -0,0 +1 @@
+"""veda.common"""
@@ -0,0 +1,273 @@
+"""Response compression policy."""
+
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from starlette_cramjam.compression import Compression
+from starlette_cramjam.middleware import get_compression_backend
+
+# Highest level of each encoding, used for the cached bodies compressed only once
+MAX_LEVELS = {Compression.br: 11, Compression.gzip: 9, Compression.deflate: 9}
+
+# Compression preference, brotli saves the most bytes for the same CPU time
+BACKENDS = [Compression.br, Compression.gzip, Compression.deflate]
+
+
+class CompressionPolicy:
+    """When, and how hard, to compress a response.
+
+    - bodies smaller than `minimum_size` are not compressed
+    - the level depends on the media type (`levels`, by media type, `type/*` or
+      `*`), 0 disables the compression and brotli levels above 9 are capped for
+      gzip and deflate
+    - streamed bodies, and bodies of at least `streaming_size` bytes, are
+      compressed at `streaming_level` and sent in chunks of `chunk_size` bytes
+    - other bodies of the `cache_paths` are compressed once at the highest level
+      and kept, by content hash, in a LRU cache of `cache_size` entries
+    - media types saving less than `min_saving` of their size, on average, are
+      only compressed once every `probe_interval` responses, to follow changes
+    """
+
+    def __init__(
+        self,
+        minimum_size: int = 1024,
+        levels: Optional[Dict[str, int]] = None,
+        streaming_size: int = 1048576,
+        streaming_level: int = 1,
+        chunk_size: int = 65536,
+        cache_paths: Optional[List[str]] = None,
+        cache_size: int = 256,
+        min_saving: float = 0.05,
+        probe_interval: int = 100,
+    ):
+        """Initialize the policy, without any saving measured."""
+        self.minimum_size = minimum_size
+        self.levels = levels if levels is not None else {"*": 4}
+        self.streaming_size = streaming_size
+        self.streaming_level = streaming_level
+        self.chunk_size = chunk_size
+        self.cache_paths = [re.compile(p) for p in cache_paths or []]
+        self.cache_size = cache_size
+        self.min_saving = min_saving
+        self.probe_interval = probe_interval
+        self._cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        # Average saving (fraction of the size) and count of responses, by media type
+        self._savings: Dict[str, Tuple[float, int]] = {}
+        self._skipped: Dict[str, int] = {}
+
+    def level(self, media_type: str) -> int:
+        """Compression level of a media type, 0 for uncompressed."""
+        for key in (media_type, media_type.split("/")[0] + "/*", "*"):
+            if key in self.levels:
+                return self.levels[key]
+
+        return 0
+
+    def is_cached(self, path: str) -> bool:
+        """Check if the responses of a path are compressed once and cached."""
+        return any(pattern.search(path) for pattern in self.cache_paths)
+
+    def worth_it(self, media_type: str) -> bool:
+        """Check if compressing the media type saves enough bytes."""
+        saving, _ = self._savings.get(media_type, (1.0, 0))
+        if saving >= self.min_saving:
+            return True
+
+        skipped = self._skipped.get(media_type, 0) + 1
+        self._skipped[media_type] = skipped
+        return skipped % self.probe_interval == 0
+
+    def record(self, media_type: str, size: int, compressed_size: int) -> None:
+        """Record the bytes saved on a response."""
+        saving, count = self._savings.get(media_type, (0.0, 0))
+        count += 1
+        saving += ((size - compressed_size) / max(size, 1) - saving) / min(count, 20)
+        self._savings[media_type] = (saving, count)
+
+    def cached(self, backend: Compression, body: bytes) -> bytes:
+        """Return the body compressed at the highest level, compressing it once."""
+        key = (backend.name, hashlib.sha1(body).hexdigest())
+        compressed = self._cache.get(key)
+        if compressed is None:
+            compressed = bytes(
+                backend.compress.compress(body, level=MAX_LEVELS[backend])
+            )
+            self._cache[key] = compressed
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+
+        return compressed
+
+
+def cap_level(backend: Compression, level: int) -> int:
+    """Level within the range of the encoding."""
+    return min(level, MAX_LEVELS[backend])
+
+
+def encoded_etag(etag: str, backend: Compression) -> str:
+    """ETag of the compressed representation, the ETag suffixed by the encoding."""
+    return f'{etag[:-1]}-{backend.name}"' if etag.endswith('"') else etag
+
+
+class CompressionMiddleware:
+    """Compress the responses as the policy says, the default policy if not given."""
+
+    def __init__(self, app: ASGIApp, policy: Optional[CompressionPolicy] = None):
+        """Wrap an ASGI application."""
+        self.app = app
+        self.policy = policy or CompressionPolicy()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request, compressing the response if the client accepts it."""
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            backend = get_compression_backend(
+                headers.get("Accept-Encoding", ""), BACKENDS
+            )
+            if backend is not None:
+                # The application validates the ETags of the representations in
+                # this encoding as the ETags of their content
+                if_none_match = headers.get("If-None-Match", "")
+                suffix = f'-{backend.name}"'
+                encoded_match = suffix in if_none_match
+                if encoded_match:
+                    request_headers = MutableHeaders(scope=scope)
+                    request_headers["If-None-Match"] = if_none_match.replace(
+                        suffix, '"'
+                    )
+                responder = CompressionResponder(
+                    self.app, self.policy, backend, encoded_match=encoded_match
+                )
+                await responder(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    """Compress a single response.
+
+    The ETag of a compressed response is suffixed by its encoding, as the ETag of a
+    304 answering a request with such an ETag (`encoded_match`).
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        policy: CompressionPolicy,
+        backend: Compression,
+        encoded_match: bool = False,
+    ):
+        """Initialize for a response not started yet."""
+        self.app = app
+        self.policy = policy
+        self.backend = backend
+        self.encoded_match = encoded_match
+        self.path = ""
+        self.send: Send
+        self.initial_message: Message = {}
+        self.started = False
+        self.compressor: Any = None
+        self.media_type = ""
+        self.size = 0
+        self.compressed_size = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request."""
+        self.path = scope["path"]
+        self.send = send
+        await self.app(scope, receive, self.send_with_compression)
+
+    def _compress_chunk(self, body: bytes, last: bool) -> bytes:
+        self.compressor.compress(body)
+        chunk = bytes(self.compressor.finish() if last else self.compressor.flush())
+        self.size += len(body)
+        self.compressed_size += len(chunk)
+        if last:
+            self.policy.record(self.media_type, self.size, self.compressed_size)
+        return chunk
+
+    async def send_with_compression(self, message: Message) -> None:
+        """Compress the response body messages."""
+        if message["type"] == "http.response.start":
+            if message["status"] == 304:
+                headers = MutableHeaders(scope=message)
+                if self.encoded_match and "ETag" in headers:
+                    headers["ETag"] = encoded_etag(headers["ETag"], self.backend)
+                headers.add_vary_header("Accept-Encoding")
+            # Sent with the first body message, once the headers are known
+            self.initial_message = message
+            return
+
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.started:
+            if self.compressor is not None:
+                message["body"] = self._compress_chunk(body, last=not more_body)
+            await self.send(message)
+            return
+
+        self.started = True
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        self.media_type = headers.get("Content-Type", "").split(";")[0].strip()
+        level = self.policy.level(self.media_type)
+        if (
+            not level
+            or "Content-Encoding" in headers
+            or (len(body) < self.policy.minimum_size and not more_body)
+            or not self.policy.worth_it(self.media_type)
+        ):
+            await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        headers["Content-Encoding"] = self.backend.name
+        headers.add_vary_header("Accept-Encoding")
+        if "ETag" in headers:
+            headers["ETag"] = encoded_etag(headers["ETag"], self.backend)
+
+        if not more_body and len(body) < self.policy.streaming_size:
+            if self.policy.is_cached(self.path):
+                compressed = self.policy.cached(self.backend, body)
+            else:
+                compressed = bytes(
+                    self.backend.compress.compress(
+                        body, level=cap_level(self.backend, level)
+                    )
+                )
+            self.policy.record(self.media_type, len(body), len(compressed))
+            headers["Content-Length"] = str(len(compressed))
+            message["body"] = compressed
+            await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        # Streamed, or large, bodies are sent as they are compressed
+        del headers["Content-Length"]
+        self.compressor = self.backend.compress.Compressor(
+            level=cap_level(self.backend, self.policy.streaming_level)
+        )
+        await self.send(self.initial_message)
+
+        chunk_size = self.policy.chunk_size
+        for start in range(0, max(len(body), 1), chunk_size):
+            last = start + chunk_size >= len(body)
+            await self.send(
+                {
+                    "type": "http.response.body",
+                    "body": self._compress_chunk(
+                        body[start : start + chunk_size], last=last and not more_body
+                    ),
+                    "more_body": more_body or not last,
+                }
+            )
@@ -0,0 +1,195 @@
+"""Adaptive concurrency limits."""
+
+import asyncio
+import math
+import re
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import orjson
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class AdaptiveLimit:
+    """Concurrency limit adjusted from the observed latency (AIMD).
+
+    The recent latency (a short moving average) is compared with the baseline
+    latency (a moving average over about `window` requests): the limit grows by
+    one every `limit` requests while the recent latency stays within `tolerance`
+    times the baseline, and is cut by `backoff` when it goes above, at most once per
+    recent latency: the requests started before a cut complete above the tolerance
+    too. Requests over the limit wait in a bounded FIFO queue.
+    """
+
+    def __init__(
+        self,
+        min_limit: int,
+        max_limit: int,
+        max_queue: int,
+        queue_timeout: float,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+        window: int = 100,
+    ):
+        """Initialize at the maximum limit."""
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.window = window
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self.recent: Optional[float] = None
+        self._backed_off = -math.inf
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        """Number of requests waiting for a slot."""
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds after which the queue should have drained."""
+        latency = self.baseline or 1.0
+        return max(1, math.ceil(latency * (self.queued + 1) / max(self.limit, 1)))
+
+    async def acquire(self) -> bool:
+        """Wait for a slot, returns False if the request should be shed."""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return True
+
+        if self.queued >= self.max_queue:
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done():
+                # The slot was handed over meanwhile, give it back
+                self.release(None)
+            else:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return False
+
+        return True
+
+    def release(self, latency: Optional[float]) -> None:
+        """Free a slot, `latency` (seconds) is None for requests not to sample."""
+        self.in_flight -= 1
+        if latency is not None:
+            self._observe(latency)
+
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _observe(self, latency: float) -> None:
+        if self.baseline is None or self.recent is None:
+            self.baseline = self.recent = latency
+            return
+
+        self.recent += (latency - self.recent) / 2
+        self.baseline += (latency - self.baseline) / self.window
+        if self.recent > self.tolerance * self.baseline:
+            now = time.monotonic()
+            if now - self._backed_off >= self.recent:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._backed_off = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class ConcurrencyLimitMiddleware:
+    """Limit the concurrent requests of each route class.
+
+    Routes are classified by the first `routes` regular expression matching their
+    path, each class has its own `AdaptiveLimit`; other routes are not limited.
+    Requests which cannot be queued, or wait longer than the queue timeout, are
+    answered 503 with a `Retry-After` header. The queue depths, limits and shed
+    requests are added to `metrics`.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        routes: Dict[str, str],
+        min_limit: int = 1,
+        max_limit: int = 10,
+        max_queue: int = 20,
+        queue_timeout: float = 10,
+        metrics: Optional[Metrics] = None,
+    ):
+        """Wrap an ASGI application."""
+        self.app = app
+        self.metrics = metrics
+        self.routes = {name: re.compile(pattern) for name, pattern in routes.items()}
+        self.limits = {
+            name: AdaptiveLimit(min_limit, max_limit, max_queue, queue_timeout)
+            for name in routes
+        }
+
+    def route_class(self, path: str) -> Optional[str]:
+        """Return the class of a path, None if it is not limited."""
+        for name, pattern in self.routes.items():
+            if pattern.search(path):
+                return name
+
+        return None
+
+    def add_metric(self, name: str, value: float) -> None:
+        """Add a count metric, if the metrics are collected."""
+        if self.metrics is not None:
+            self.metrics.add_metric(name=name, unit=MetricUnit.Count, value=value)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request within the limit of its route class."""
+        name = self.route_class(scope["path"]) if scope["type"] == "http" else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limits[name]
+        self.add_metric(f"ConcurrencyQueueDepth.{name}", limit.queued)
+        if not await limit.acquire():
+            self.add_metric(f"LoadShed.{name}", 1)
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"retry-after", str(limit.retry_after()).encode()),
+                    ],
+                }
+            )
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": orjson.dumps({"detail": "Too many requests, retry later."}),
+                }
+            )
+            return
+
+        self.add_metric(f"ConcurrencyLimit.{name}", limit.limit)
+        started = time.monotonic()
+        latency: Optional[float] = None
+        try:
+            await self.app(scope, receive, send)
+            latency = time.monotonic() - started
+        finally:
+            # Failed requests do not tell how loaded the server is
+            limit.release(latency)
@@ -155,6 +155,7 @@ def create_dashboard_schema(cursor, username: str) -> None:
         sql.SQL(
             "CREATE SCHEMA IF NOT EXISTS dashboard;"
             "GRANT ALL ON SCHEMA dashboard TO {username};"
+            "ALTER DEFAULT PRIVILEGES IN SCHEMA dashboard GRANT ALL ON TABLES TO {username};"
             "ALTER ROLE {username} SET SEARCH_PATH TO pgstac, dashboard, public;"
         ).format(username=sql.Identifier(username))
     )
@@ -202,7 +203,7 @@ def create_collection_search_functions(cursor) -> None:
     searches := search_query(_search);
     _where := searches._where;
     orderby := searches.orderby;
-    search_where := where_stats(_where);
+    search_where := where_stats(_where, false, _search->'conf');
     total_count := coalesce(search_where.total_count, search_where.estimated_count);
 
     IF token_type='prev' THEN
@@ -255,18 +256,177 @@ def create_collection_summaries_functions(cursor) -> None:
     Functions to summarize datetimes and raster statistics for 'default' collections of items
     """
 
+    # Distinct item datetimes of the collections, maintained by statement triggers
+    # (with transition tables) on the items table and its partitions
+    item_datetimes_sql = """
+    CREATE TABLE IF NOT EXISTS dashboard.item_datetimes (
+        collection text NOT NULL,
+        datetime timestamptz NOT NULL,
+        end_datetime timestamptz NOT NULL,
+        PRIMARY KEY (collection, datetime, end_datetime)
+    );
+    -- Partitions with the triggers, and scanned once
+    CREATE TABLE IF NOT EXISTS dashboard.item_datetimes_partitions (
+        partition text PRIMARY KEY,
+        collection text NOT NULL
+    );
+    -- Count of the changes of the datetimes of a collection, and at its last summary
+    CREATE TABLE IF NOT EXISTS dashboard.item_datetimes_collections (
+        collection text PRIMARY KEY,
+        changes bigint NOT NULL DEFAULT 0,
+        summarized bigint NOT NULL DEFAULT 0
+    );
+    """
+    cursor.execute(sql.SQL(item_datetimes_sql))
+
+    # New datetimes are added from the inserted rows, and the datetimes of the
+    # deleted rows are removed if no other item of the collection has them, so
+    # loading or deleting items costs O(items changed).
+    item_datetimes_triggerfunc_sql = """
+    CREATE OR REPLACE FUNCTION dashboard.item_datetimes_triggerfunc()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    SECURITY DEFINER
+    SET search_path TO 'pgstac', 'public'
+    AS $function$
+    BEGIN
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            WITH added AS (
+                INSERT INTO dashboard.item_datetimes (collection, datetime, end_datetime)
+                SELECT DISTINCT collection, datetime, end_datetime FROM newdata
+                WHERE datetime IS NOT NULL AND end_datetime IS NOT NULL
+                ON CONFLICT DO NOTHING
+                RETURNING collection
+            )
+            INSERT INTO dashboard.item_datetimes_collections AS s (collection, changes)
+            SELECT DISTINCT collection, 1 FROM added
+            ON CONFLICT (collection) DO UPDATE SET changes = s.changes + 1;
+        END IF;
+
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            WITH removed AS (
+                DELETE FROM dashboard.item_datetimes d
+                USING (SELECT DISTINCT collection, datetime, end_datetime FROM olddata) o
+                WHERE d.collection = o.collection
+                AND d.datetime = o.datetime
+                AND d.end_datetime = o.end_datetime
+                AND NOT EXISTS (
+                    SELECT 1 FROM items i
+                    WHERE i.collection = o.collection
+                    AND i.datetime = o.datetime
+                    AND i.end_datetime = o.end_datetime
+                )
+                RETURNING d.collection
+            )
+            INSERT INTO dashboard.item_datetimes_collections AS s (collection, changes)
+            SELECT DISTINCT collection, 1 FROM removed
+            ON CONFLICT (collection) DO UPDATE SET changes = s.changes + 1;
+        END IF;
+
+        RETURN NULL;
+    END;
+    $function$
+    ;
+    """
+    cursor.execute(sql.SQL(item_datetimes_triggerfunc_sql))
+
+    # Statement triggers fire for the table a statement targets: the items table for
+    # the pgstac functions, and its partitions for the pypgstac loader which writes
+    # to them directly.
+    create_item_datetimes_triggers_sql = """
+    CREATE OR REPLACE FUNCTION dashboard.create_item_datetimes_triggers(_table text)
+    RETURNS void
+    LANGUAGE plpgsql
+    SECURITY DEFINER
+    SET search_path TO 'pgstac', 'public'
+    AS $function$
+    DECLARE
+        op text;
+    BEGIN
+        FOREACH op IN ARRAY ARRAY['insert', 'update', 'delete'] LOOP
+            EXECUTE format(
+                'DROP TRIGGER IF EXISTS %I ON %I',
+                'item_datetimes_' || op || '_trigger', _table
+            );
+            EXECUTE format(
+                'CREATE TRIGGER %I AFTER %s ON %I REFERENCING %s '
+                'FOR EACH STATEMENT EXECUTE FUNCTION dashboard.item_datetimes_triggerfunc()',
+                'item_datetimes_' || op || '_trigger', op, _table,
+                CASE op
+                    WHEN 'insert' THEN 'NEW TABLE AS newdata'
+                    WHEN 'update' THEN 'OLD TABLE AS olddata NEW TABLE AS newdata'
+                    ELSE 'OLD TABLE AS olddata'
+                END
+            );
+        END LOOP;
+    END;
+    $function$
+    ;
+    SELECT dashboard.create_item_datetimes_triggers('items');
+    """
+    cursor.execute(sql.SQL(create_item_datetimes_triggers_sql))
+
+    # The triggers are added to the new partitions, which are scanned once (their
+    # items are all new). Partitions dropped without their items being deleted, or a
+    # forced refresh, rescan the collection.
+    update_collection_datetimes_sql = """
+    CREATE OR REPLACE FUNCTION dashboard.update_collection_datetimes(id text, force boolean DEFAULT false)
+    RETURNS void
+    LANGUAGE plpgsql
+    SECURITY DEFINER
+    SET search_path TO 'pgstac', 'public'
+    AS $function$
+    DECLARE
+        p record;
+    BEGIN
+        -- Waits for the transactions changing the datetimes of the collection
+        INSERT INTO dashboard.item_datetimes_collections AS s (collection) VALUES ($1)
+        ON CONFLICT (collection) DO UPDATE SET summarized = s.changes;
+
+        IF force OR EXISTS (
+            SELECT 1 FROM dashboard.item_datetimes_partitions dp
+            WHERE dp.collection = $1
+            AND NOT EXISTS (SELECT 1 FROM partitions_view pv WHERE pv.partition = dp.partition)
+        ) THEN
+            DELETE FROM dashboard.item_datetimes d WHERE d.collection = $1;
+            DELETE FROM dashboard.item_datetimes_partitions dp WHERE dp.collection = $1;
+        END IF;
+
+        FOR p IN
+            SELECT pv.partition
+            FROM partitions_view pv
+            LEFT JOIN dashboard.item_datetimes_partitions dp USING (partition)
+            WHERE pv.collection = $1 AND dp.partition IS NULL
+        LOOP
+            PERFORM dashboard.create_item_datetimes_triggers(p.partition);
+            EXECUTE format(
+                'INSERT INTO dashboard.item_datetimes (collection, datetime, end_datetime) '
+                'SELECT DISTINCT collection, datetime, end_datetime FROM %I '
+                'WHERE collection = %L AND datetime IS NOT NULL AND end_datetime IS NOT NULL '
+                'ON CONFLICT DO NOTHING',
+                p.partition, $1
+            );
+            INSERT INTO dashboard.item_datetimes_partitions (partition, collection)
+            VALUES (p.partition, $1);
+        END LOOP;
+    END;
+    $function$
+    ;
+    """
+    cursor.execute(sql.SQL(update_collection_datetimes_sql))
+
     periodic_datetime_summary_sql = """
     CREATE OR REPLACE FUNCTION dashboard.periodic_datetime_summary(id text) RETURNS jsonb
     LANGUAGE sql
-    IMMUTABLE PARALLEL SAFE
+    STABLE PARALLEL SAFE
     SET search_path TO 'pgstac', 'public'
     AS $function$
         SELECT to_jsonb(
             array[
                 to_char(min(datetime) at time zone 'Z', 'YYYY-MM-DD"T"HH24:MI:SS"Z"'),
                 to_char(max(end_datetime) at time zone 'Z', 'YYYY-MM-DD"T"HH24:MI:SS"Z"')
-            ])​
-        FROM items WHERE collection=$1;
+            ])
+        FROM dashboard.item_datetimes WHERE collection=$1;
     ;
     $function$
     ;
@@ -276,11 +436,11 @@ def create_collection_summaries_functions(cursor) -> None:
     distinct_datetime_summary_sql = """
     CREATE OR REPLACE FUNCTION dashboard.discrete_datetime_summary(id text) RETURNS jsonb
     LANGUAGE sql
-    IMMUTABLE PARALLEL SAFE
+    STABLE PARALLEL SAFE
     SET search_path TO 'pgstac', 'public'
     AS $function$
         SELECT jsonb_agg(distinct to_char(datetime at time zone 'Z', 'YYYY-MM-DD"T"HH24:MI:SS"Z"'))
-        FROM items WHERE collection=$1;
+        FROM dashboard.item_datetimes WHERE collection=$1;
     ;
     $function$
     ;
@@ -293,6 +453,7 @@ def create_collection_summaries_functions(cursor) -> None:
     LANGUAGE sql
     SET search_path TO 'pgstac', 'public'
     AS $function$
+    SELECT dashboard.update_collection_datetimes($1);
     UPDATE collections SET
         "content" = "content" ||
         jsonb_build_object(
@@ -329,6 +490,30 @@ def create_collection_summaries_functions(cursor) -> None:
     cursor.execute(sql.SQL(update_all_collection_default_summaries_sql))
 
 
+def create_collections_notify_trigger(cursor) -> None:
+    """Notify the STAC API of collection changes, so that it refreshes its collections snapshot."""
+    cursor.execute(
+        sql.SQL(
+            """
+            CREATE OR REPLACE FUNCTION dashboard.notify_collections_changed()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            AS $function$
+            BEGIN
+                PERFORM pg_notify('pgstac_collections', TG_OP);
+                RETURN NULL;
+            END;
+            $function$
+            ;
+            DROP TRIGGER IF EXISTS collections_notify_trigger ON pgstac.collections;
+            CREATE TRIGGER collections_notify_trigger
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON pgstac.collections
+            FOR EACH STATEMENT EXECUTE FUNCTION dashboard.notify_collections_changed();
+            """
+        )
+    )
+
+
 def handler(event, context):
     """Lambda Handler."""
     print(f"Handling {event}")
@@ -446,6 +631,9 @@ def handler(event, context):
                 )
                 create_collection_summaries_functions(cursor=cur)
 
+                print("Creating collections change notification trigger...")
+                create_collections_notify_trigger(cursor=cur)
+
     except Exception as e:
         print(f"Unable to bootstrap database with exception={e}")
         return send(event, context, "FAILED", {"message": str(e)})
@@ -7,7 +7,9 @@ import os
 from mangum import Mangum
 from src.app import app
 from src.config import ApiSettings
+from src.db import DB_CONNECTION_KWARGS
 from src.monitoring import logger, metrics, tracer
+from src.slowlog import slow_queries
 
 from titiler.pgstac.db import connect_to_db
 
@@ -20,7 +22,12 @@ logging.getLogger("mangum.http").setLevel(logging.ERROR)
 @app.on_event("startup")
 async def startup_event() -> None:
     """Connect to database on startup."""
-    await connect_to_db(app, settings=settings.load_postgres_settings())
+    await connect_to_db(
+        app,
+        settings=settings.load_postgres_settings(),
+        pool_kwargs=DB_CONNECTION_KWARGS,
+    )
+    slow_queries.pool = app.state.dbpool
 
 
 handler = Mangum(app, lifespan="off", api_gateway_base_path=app.root_path)
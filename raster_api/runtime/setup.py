@@ -16,13 +16,15 @@ inst_reqs = [
     "aws_xray_sdk>=2.6.0,<3",
     "aws-lambda-powertools>=1.18.0",
     "python-multipart==0.0.7",
+    # Shared middlewares, installed from common/runtime
+    "veda.common",
 ]
 
 extra_reqs = {
     # https://www.psycopg.org/psycopg3/docs/api/pq.html#pq-module-implementations
-    "psycopg": ["psycopg[pool]"],  # pure python implementation
-    "psycopg-c": ["psycopg[c,pool]"],  # C implementation of the libpq wrapper
-    "psycopg-binary": ["psycopg[binary,pool]"],  # pre-compiled C implementation
+    "psycopg": ["psycopg[pool]>=3.2"],  # pure python implementation
+    "psycopg-c": ["psycopg[c,pool]>=3.2"],  # C implementation of the libpq wrapper
+    "psycopg-binary": ["psycopg[binary,pool]>=3.2"],  # pre-compiled C implementation
     "test": ["pytest", "pytest-cov", "pytest-asyncio", "requests", "brotlipy"],
 }
 
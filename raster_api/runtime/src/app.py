@@ -6,15 +6,27 @@ from contextlib import asynccontextmanager
 from aws_lambda_powertools.metrics import MetricUnit
 from src.algorithms import PostProcessParams
 from src.config import ApiSettings
+from src.db import DB_CONNECTION_KWARGS, QUERY_STATUS_CODES, QueryCancellationMiddleware
 from src.dependencies import ColorMapParams, ItemPathParams
-from src.extensions import stacViewerExtension
-from src.monitoring import LoggerRouteHandler, logger, metrics, tracer
+from src.extensions import cogAuditExtension, stacViewerExtension
+from src.monitoring import (
+    CorrelationIdMiddleware,
+    LoggerRouteHandler,
+    logger,
+    metrics,
+    pool_metrics,
+)
+from src.overviews import OverviewPgSTACReader, OverviewReader
+from src.slowlog import slow_queries
+from src.tilecache import SeededTileMiddleware, TileStore
 from src.version import __version__ as veda_raster_version
+from src.versioning import TileVersionMiddleware, TileVersions
+from veda_common.compression import CompressionMiddleware, CompressionPolicy
+from veda_common.limiter import ConcurrencyLimitMiddleware
 
 from fastapi import APIRouter, FastAPI
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
-from starlette_cramjam.middleware import CompressionMiddleware
 from titiler.core.errors import DEFAULT_STATUS_CODES, add_exception_handlers
 from titiler.core.factory import MultiBaseTilerFactory, TilerFactory, TMSFactory
 from titiler.core.middleware import CacheControlMiddleware
@@ -24,7 +36,6 @@ from titiler.extensions import cogValidateExtension, cogViewerExtension
 from titiler.mosaic.errors import MOSAIC_STATUS_CODES
 from titiler.pgstac.db import close_db_connection, connect_to_db
 from titiler.pgstac.factory import MosaicTilerFactory
-from titiler.pgstac.reader import PgSTACReader
 
 logging.getLogger("botocore.credentials").disabled = True
 logging.getLogger("botocore.utils").disabled = True
@@ -32,6 +43,8 @@ logging.getLogger("rio-tiler").setLevel(logging.ERROR)
 
 settings = ApiSettings()
 
+# Content versions of the mosaics and items, shared by the tile middlewares
+tile_versions = TileVersions(ttl=settings.tile_version_ttl)
 
 if settings.debug:
     optional_headers = [OptionalHeader.server_timing, OptionalHeader.x_assets]
@@ -43,7 +56,12 @@ else:
 async def lifespan(app: FastAPI):
     """FastAPI Lifespan."""
     # Create Connection Pool
-    await connect_to_db(app, settings=settings.load_postgres_settings())
+    await connect_to_db(
+        app,
+        settings=settings.load_postgres_settings(),
+        pool_kwargs=DB_CONNECTION_KWARGS,
+    )
+    slow_queries.pool = app.state.dbpool
     yield
     # Close the Connection Pool
     await close_db_connection(app)
@@ -62,6 +80,7 @@ app = FastAPI(
 router = APIRouter(route_class=LoggerRouteHandler)
 add_exception_handlers(app, DEFAULT_STATUS_CODES)
 add_exception_handlers(app, MOSAIC_STATUS_CODES)
+add_exception_handlers(app, QUERY_STATUS_CODES)
 
 ###############################################################################
 # /mosaic - PgSTAC Mosaic titiler endpoint
@@ -90,7 +109,7 @@ app.include_router(mosaic.router, prefix="/mosaic", tags=["Mosaic"])
 # /stac - Custom STAC titiler endpoint
 ###############################################################################
 stac = MultiBaseTilerFactory(
-    reader=PgSTACReader,
+    reader=OverviewPgSTACReader,
     path_dependency=ItemPathParams,
     optional_headers=optional_headers,
     router_prefix="/stac",
@@ -109,6 +128,7 @@ app.include_router(stac.router, tags=["Items"], prefix="/stac")
 # /cog - External Cloud Optimized GeoTIFF endpoints
 ###############################################################################
 cog = TilerFactory(
+    reader=OverviewReader,
     router_prefix="/cog",
     optional_headers=optional_headers,
     environment_dependency=settings.get_gdal_config,
@@ -116,6 +136,10 @@ cog = TilerFactory(
     extensions=[
         cogValidateExtension(),
         cogViewerExtension(),
+        cogAuditExtension(
+            concurrency=settings.audit_concurrency,
+            max_items=settings.audit_max_items,
+        ),
     ],
     colormap_dependency=ColorMapParams,
 )
@@ -140,20 +164,48 @@ def versions():
     return pkg_versions
 
 
+if settings.debug:
+
+    @app.get("/debug/pools", include_in_schema=False)
+    def debug_pools(request: Request):
+        """Connection pool status and timings."""
+        return {
+            "pool": request.app.state.dbpool.get_stats(),
+            "timings": pool_metrics.timings,
+        }
+
+    @app.get("/debug/slow-queries", include_in_schema=False)
+    def debug_slow_queries():
+        """Most recent slow queries, with their plan when sampled."""
+        return {"slow_queries": slow_queries.recent()}
+
+
 # Add support for non-default projections
 tms = TMSFactory()
 app.include_router(tms.router, tags=["Tiling Schemes"])
 
-# Set all CORS enabled origins
-if settings.cors_origins:
+app.add_middleware(
+    ConcurrencyLimitMiddleware,
+    routes=settings.concurrency_routes,
+    min_limit=settings.concurrency_min_limit,
+    max_limit=settings.concurrency_max_limit,
+    max_queue=settings.concurrency_max_queue,
+    queue_timeout=settings.concurrency_queue_timeout,
+    metrics=metrics,
+)
+app.add_middleware(QueryCancellationMiddleware)
+if settings.tile_store:
     app.add_middleware(
-        CORSMiddleware,
-        allow_origins=settings.cors_origins,
-        allow_credentials=True,
-        allow_methods=["GET", "POST", "OPTIONS"],
-        allow_headers=["*"],
+        SeededTileMiddleware,
+        store=TileStore(settings.tile_store),
+        versions=tile_versions,
+        ttl=settings.tile_store_ttl,
     )
-
+app.add_middleware(
+    TileVersionMiddleware,
+    versions=tile_versions,
+    cachecontrol=settings.tile_cachecontrol,
+)
 app.add_middleware(
     CacheControlMiddleware,
     cachecontrol=settings.cachecontrol,
@@ -161,42 +213,30 @@ app.add_middleware(
 )
 app.add_middleware(
     CompressionMiddleware,
-    minimum_size=0,
-    exclude_mediatype={
-        "image/jpeg",
-        "image/jpg",
-        "image/png",
-        "image/jp2",
-        "image/webp",
-    },
+    policy=CompressionPolicy(
+        minimum_size=settings.compression_minimum_size,
+        levels=settings.compression_levels,
+        streaming_size=settings.compression_streaming_size,
+        streaming_level=settings.compression_streaming_level,
+        cache_paths=settings.compression_cache_paths,
+        cache_size=settings.compression_cache_size,
+    ),
 )
 
 
 # If the correlation header is used in the UI, we can analyze traces that originate from a given user or client
-@app.middleware("http")
-async def add_correlation_id(request: Request, call_next):
-    """Add correlation ids to all requests and subsequent logs/traces"""
-    # Get correlation id from X-Correlation-Id header if provided
-    corr_id = request.headers.get("x-correlation-id")
-    if not corr_id:
-        try:
-            # If empty, use request id from aws context
-            corr_id = request.scope["aws.context"].aws_request_id
-        except KeyError:
-            # If empty, use uuid
-            corr_id = "local"
-
-    # Add correlation id to logs
-    logger.set_correlation_id(corr_id)
-
-    # Add correlation id to traces
-    tracer.put_annotation(key="correlation_id", value=corr_id)
-
-    response = await tracer.capture_method(call_next)(request)
-    # Return correlation header in response
-    response.headers["X-Correlation-Id"] = corr_id
-    logger.info("Request completed")
-    return response
+app.add_middleware(CorrelationIdMiddleware)
+
+# Set all CORS enabled origins, outermost for every response (shed, cached or
+# seeded) to have the CORS headers
+if settings.cors_origins:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.cors_origins,
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "OPTIONS"],
+        allow_headers=["*"],
+    )
 
 
 @app.exception_handler(Exception)
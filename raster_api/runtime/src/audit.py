@@ -0,0 +1,286 @@
+"""COG layout audit of the assets of a collection or a mosaic search.
+
+The GeoTIFF assets of the items are validated concurrently, with `rio-cogeo`, and
+checked for the layout problems which slow down the tiles:
+
+- `no_overviews`: a dataset larger than 512 pixels without overviews
+- `not_tiled`: a striped dataset
+- `block_size`: blocks smaller than 256, or larger than 1024, pixels
+- `compression`: no compression, or a compression without a predictor
+- `header`: IFDs (headers) not within the first `GDAL_INGESTED_BYTES_AT_OPEN`
+  bytes, read by GDAL when it opens the file
+
+    python -m src.audit --collection no2-monthly --output no2-monthly.csv
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import psycopg
+import rasterio
+from psycopg import sql
+from rio_cogeo.cogeo import cog_validate
+from src.config import ApiSettings
+
+# Media types, and extensions, of the audited assets
+GEOTIFF_TYPES = ("image/tiff",)
+GEOTIFF_EXTENSIONS = (".tif", ".tiff")
+
+# Compressions of the GeoTIFFs which are not worth a predictor (lossy or not
+# byte-oriented), others should use one
+LOSSY_COMPRESSIONS = ("JPEG", "WEBP", "JXL", "LERC", "LERC_DEFLATE", "LERC_ZSTD")
+
+# Bytes read by GDAL at the opening of a file, when GDAL_INGESTED_BYTES_AT_OPEN
+# is not set
+DEFAULT_INGESTED_BYTES = 16384
+
+SEARCH_SQL = "SELECT _where, orderby FROM searches WHERE hash = %s;"
+
+# The items are read from the items table (all of them, without a limit), their
+# assets hydrated with the item assets of their collection
+ITEMS_SQL = """
+    WITH i AS (
+        SELECT id, collection, content FROM items
+        WHERE {where} ORDER BY {orderby} LIMIT %s
+    )
+    SELECT i.id, content_hydrate(i.content->'assets', c.base_item->'assets')
+    FROM i JOIN collections c ON c.id = i.collection;
+"""
+
+
+@dataclass
+class AssetAudit:
+    """Layout of a COG, and the problems found."""
+
+    item: str
+    asset: str
+    href: str
+    valid: bool = False
+    width: Optional[int] = None
+    height: Optional[int] = None
+    overviews: List[int] = field(default_factory=list)
+    block_size: Optional[Tuple[int, int]] = None
+    compression: Optional[str] = None
+    predictor: Optional[str] = None
+    header_size: Optional[int] = None
+    problems: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+
+def header_size(src: Any) -> int:
+    """Bytes before the first block of data, or after the last IFD if it is further.
+
+    The IFDs of a COG precede the data, its header ends at the first block.
+    """
+    levels = [None] + list(range(len(src.overviews(1))))
+    ifds = [src.get_tag_item("IFD_OFFSET", "TIFF", bidx=1, ovr=ovr) for ovr in levels]
+    blocks = [
+        src.get_tag_item("BLOCK_OFFSET_0_0", "TIFF", bidx=1, ovr=ovr) for ovr in levels
+    ]
+    last_ifd = max((int(offset) for offset in ifds if offset), default=0)
+    first_block = min((int(offset) for offset in blocks if offset), default=0)
+    return max(last_ifd, first_block)
+
+
+def audit(item: str, asset: str, href: str, ingested_bytes: int) -> AssetAudit:
+    """Audit a COG, in the current GDAL environment."""
+    result = AssetAudit(item=item, asset=asset, href=href)
+    try:
+        result.valid, result.errors, result.warnings = cog_validate(href, quiet=True)
+        with rasterio.open(href) as src:
+            width, height = src.width, src.height
+            block_height, block_width = src.block_shapes[0]
+            result.width, result.height = width, height
+            result.overviews = src.overviews(1)
+            result.block_size = (block_height, block_width)
+            structure = src.tags(ns="IMAGE_STRUCTURE")
+            result.compression = structure.get("COMPRESSION")
+            result.predictor = structure.get("PREDICTOR")
+            result.header_size = header_size(src) if src.driver == "GTiff" else None
+    except Exception as e:
+        result.problems.append("unreadable")
+        result.errors.append(str(e))
+        return result
+
+    if max(width, height) > 512 and not result.overviews:
+        result.problems.append("no_overviews")
+    if block_width == width and width > 512:
+        result.problems.append("not_tiled")
+    elif block_width != width and not (
+        256 <= min(block_height, block_width) <= max(block_height, block_width) <= 1024
+    ):
+        result.problems.append("block_size")
+    if result.compression is None or (
+        result.compression not in LOSSY_COMPRESSIONS and result.predictor in (None, "1")
+    ):
+        result.problems.append("compression")
+    if result.header_size is not None and result.header_size > ingested_bytes:
+        result.problems.append("header")
+
+    return result
+
+
+def search_assets(
+    conn: Any, search: Tuple[str, str], assets: List[str], limit: Optional[int]
+) -> Iterator[Tuple[str, str, str]]:
+    """Item id, asset key and href of the GeoTIFF assets of the items of a search.
+
+    `search` is the where clause and the order of the items, all of them are read
+    if `limit` is None.
+    """
+    where, orderby = (clause.replace("%", "%%") for clause in search)
+    with conn.cursor() as cursor:
+        cursor.execute(ITEMS_SQL.format(where=where, orderby=orderby), (limit,))
+        for item, item_assets in cursor:
+            for key, asset in (item_assets or {}).items():
+                if assets and key not in assets:
+                    continue
+                href = asset.get("href", "")
+                media_type = asset.get("type", "").split(";")[0].strip()
+                if href and (
+                    assets
+                    or media_type in GEOTIFF_TYPES
+                    or (not media_type and href.lower().endswith(GEOTIFF_EXTENSIONS))
+                ):
+                    yield item, key, href
+
+
+def mosaic_search(
+    conn: Any, collection: Optional[str], searchid: Optional[str]
+) -> Optional[Tuple[str, str]]:
+    """Where clause and order of the items of a collection or a mosaic search."""
+    if collection is not None:
+        return sql.SQL("collection = {}").format(collection).as_string(conn), "id"
+
+    with conn.cursor() as cursor:
+        cursor.execute(SEARCH_SQL, (searchid,))
+        row = cursor.fetchone()
+
+    return (row[0], row[1]) if row else None
+
+
+def run(
+    assets: List[Tuple[str, str, str]], gdal_config: Dict, concurrency: int
+) -> List[AssetAudit]:
+    """Audit assets, `concurrency` at a time."""
+    ingested_bytes = int(
+        gdal_config.get("GDAL_INGESTED_BYTES_AT_OPEN")
+        or os.environ.get("GDAL_INGESTED_BYTES_AT_OPEN")
+        or DEFAULT_INGESTED_BYTES
+    )
+
+    def audit_in_env(asset: Tuple[str, str, str]) -> AssetAudit:
+        # The GDAL environment is per thread
+        with rasterio.Env(**gdal_config):
+            return audit(*asset, ingested_bytes=ingested_bytes)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(audit_in_env, assets))
+
+
+def summary(results: List[AssetAudit]) -> Dict[str, int]:
+    """Count of the assets, invalid assets and assets with each problem."""
+    counts = {"assets": len(results), "invalid": sum(not r.valid for r in results)}
+    for result in results:
+        for problem in result.problems:
+            counts[problem] = counts.get(problem, 0) + 1
+    return counts
+
+
+def to_csv(results: List[AssetAudit]) -> str:
+    """Report, as CSV, with the lists joined by `;`."""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=[f.name for f in fields(AssetAudit)])
+    writer.writeheader()
+    for result in results:
+        row = asdict(result)
+        for key in ("overviews", "block_size", "problems", "errors", "warnings"):
+            row[key] = ";".join(str(v) for v in row[key] or [])
+        writer.writerow(row)
+    return output.getvalue()
+
+
+def to_json(results: List[AssetAudit]) -> Dict[str, Any]:
+    """Report, as a JSON object."""
+    return {"summary": summary(results), "assets": [asdict(r) for r in results]}
+
+
+parser = argparse.ArgumentParser(
+    description="Audit the COG layout of the assets of a collection or a search"
+)
+source = parser.add_mutually_exclusive_group(required=True)
+source.add_argument(
+    "--collection",
+    dest="collection",
+    type=str,
+    help="Collection id",
+)
+source.add_argument(
+    "--searchid",
+    dest="searchid",
+    type=str,
+    help="Mosaic search id (hash)",
+)
+parser.add_argument(
+    "--asset",
+    dest="assets",
+    type=str,
+    action="append",
+    default=[],
+    help="Asset key (repeat for each asset), all the GeoTIFF assets by default",
+)
+parser.add_argument(
+    "--limit",
+    dest="limit",
+    type=int,
+    default=None,
+    help="Maximum number of items, all the items by default",
+)
+parser.add_argument(
+    "--concurrency",
+    dest="concurrency",
+    type=int,
+    default=16,
+    help="Number of assets audited at a time",
+)
+parser.add_argument(
+    "--output",
+    dest="output",
+    type=str,
+    default=None,
+    help="Report file, CSV or JSON (.json), the summary is printed by default",
+)
+
+
+def main(args: argparse.Namespace) -> None:
+    """Audit the assets."""
+    settings = ApiSettings()
+    url = str(settings.load_postgres_settings().database_url)
+    with psycopg.connect(url) as conn:
+        search = mosaic_search(conn, args.collection, args.searchid)
+        if search is None:
+            parser.error(f"Mosaic {args.searchid} not found")
+        assets = list(search_assets(conn, search, args.assets, args.limit))
+
+    print(f"Auditing {len(assets)} assets")
+    results = run(assets, settings.get_gdal_config(), args.concurrency)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            if args.output.endswith(".json"):
+                json.dump(to_json(results), f, indent=2)
+            else:
+                f.write(to_csv(results))
+
+    print(", ".join(f"{count} {key}" for key, count in summary(results).items()))
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
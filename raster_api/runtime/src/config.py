@@ -3,7 +3,7 @@
 import base64
 import json
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 
 import boto3
 from pydantic import Field, field_validator
@@ -61,6 +61,68 @@ class ApiSettings(BaseSettings):
 
     pgstac_secret_arn: Optional[str] = None
 
+    # Queries slower than this many milliseconds are logged, 0 disables the log
+    slow_query_ms: float = 1000
+    # Fraction of the slow queries which are explained on a separate connection
+    slow_query_explain_rate: float = 0.05
+    # Number of slow queries kept in memory for the debug endpoint
+    slow_query_log_size: int = 100
+    # statement_timeout, in milliseconds, of the queries of the endpoints under a
+    # path (the longest matching path wins), as a JSON object
+    statement_timeouts: Dict[str, int] = {"/mosaic": 20000}
+    # Route classes with an adaptive concurrency limit, by path regular expression
+    concurrency_routes: Dict[str, str] = {
+        "tiles": r"/tiles/",
+        "statistics": r"/(statistics|point|bbox|feature|preview)",
+    }
+    # Bounds of the concurrency limit of each route class, the maximum is the
+    # initial limit and should not exceed the connection pool size
+    concurrency_min_limit: int = 1
+    concurrency_max_limit: int = 10
+    # Requests over the limit wait in a queue of this size, at most this many seconds
+    concurrency_max_queue: int = 20
+    concurrency_queue_timeout: float = 10
+    # Responses smaller than this many bytes are not compressed
+    compression_minimum_size: int = 1024
+    # Compression level by media type, `type/*` or `*` (brotli levels, capped at 9
+    # for gzip and deflate), 0 disables the compression
+    compression_levels: Dict[str, int] = {"*": 4, "image/*": 0}
+    # Streamed responses, and responses of at least this many bytes, are
+    # compressed at the streaming level as they are sent
+    compression_streaming_size: int = 1048576
+    compression_streaming_level: int = 1
+    # Responses of these paths (regular expressions) are compressed once, at the
+    # highest level, and the compressed bodies kept in a LRU cache of this size
+    compression_cache_paths: List[str] = [
+        r"/tilejson\.json$",
+        r"/WMTSCapabilities\.xml$",
+        r"^/tileMatrixSets",
+    ]
+    compression_cache_size: int = 256
+    # Cache-Control of the tiles requested with the current content version of
+    # their mosaic or item, as listed by the tilejson documents
+    tile_cachecontrol: str = "public, max-age=31536000, immutable"
+    # Seconds the content versions of the mosaics and items are kept in memory
+    tile_version_ttl: float = 60
+    # Directory, or s3://bucket/prefix URL, of the tiles rendered by `src.seed`,
+    # served instead of rendering them when they are found
+    tile_store: Optional[str] = None
+    # Seconds the seeded (or not) state of the mosaic versions is kept in memory,
+    # the tiles of the versions not seeded are not looked up in the store
+    tile_store_ttl: float = 300
+    # Directory of the overview sidecars of the COGs without overviews, built in
+    # the background (or by `src.overviews`), None disables them
+    overview_cache_dir: Optional[str] = None
+    # Datasets larger than this many pixels, on their longest side, get a sidecar
+    overview_min_size: int = 2048
+    # Size, on its longest side, and resampling method of the sidecars
+    overview_size: int = 1024
+    overview_resampling: str = "average"
+    # Number of assets audited at a time by /cog/audit, and maximum number of
+    # items of an audit, kept small as the endpoint audits them synchronously
+    audit_concurrency: int = 16
+    audit_max_items: int = 100
+
     model_config = {
         "env_file": ".env",
         "extra": "ignore",
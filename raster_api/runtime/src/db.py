@@ -0,0 +1,148 @@
+"""Database connection instrumentation and query cancellation."""
+
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Set
+
+from psycopg import Cursor
+from psycopg.errors import QueryCanceled
+from psycopg.pq import TransactionStatus
+from src.config import ApiSettings
+from src.monitoring import pool_metrics, sql_function
+from src.slowlog import slow_queries
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+settings = ApiSettings()
+
+# Status of the queries cancelled by their statement timeout
+QUERY_STATUS_CODES = {QueryCanceled: 504}
+
+
+class RequestQueries:
+    """Cancellation callbacks of the queries a request is running."""
+
+    def __init__(self, scope: Scope):
+        """Initialize for a connected client."""
+        self.scope = scope
+        self.disconnected = False
+        self.cancels: Set[Callable[[], Any]] = set()
+
+    def disconnect(self) -> None:
+        """Cancel the running queries, the client is gone."""
+        self.disconnected = True
+        for cancel in list(self.cancels):
+            cancel()
+
+
+# Set by `QueryCancellationMiddleware` for each request
+_request_queries: ContextVar[Optional[RequestQueries]] = ContextVar(
+    "request_queries", default=None
+)
+
+
+class QueryCancellationMiddleware:
+    """Cancel the database queries of a request when its client disconnects.
+
+    The ASGI `receive` channel is read ahead by a task, which forwards the messages
+    to the application and catches the disconnection while the request is handled.
+    """
+
+    def __init__(self, app: ASGIApp):
+        """Wrap an ASGI application."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request, watching for the client disconnection."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries(scope)
+        messages: "asyncio.Queue[Message]" = asyncio.Queue()
+
+        async def read() -> None:
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    # Sending the cancel requests blocks
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, queries.disconnect
+                    )
+                    return
+
+        async def receive_message() -> Message:
+            if queries.disconnected and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        reader = asyncio.ensure_future(read())
+        token = _request_queries.set(queries)
+        try:
+            await self.app(scope, receive_message, send)
+        finally:
+            _request_queries.reset(token)
+            reader.cancel()
+
+
+def statement_timeout(scope: Scope, timeouts: Dict[str, int]) -> int:
+    """Statement timeout of the endpoint, from the longest matching path prefix."""
+    route = scope.get("route")
+    path = route.path if route is not None else scope["path"]
+    prefixes = [prefix for prefix in timeouts if path.startswith(prefix)]
+    return timeouts[max(prefixes, key=len)] if prefixes else 0
+
+
+class TimedCursor(Cursor):
+    """psycopg cursor recording the time of its queries by pgstac function.
+
+    Queries run with the statement timeout of their endpoint and are cancelled
+    when the client disconnects.
+    """
+
+    def _set_statement_timeout(self, queries: RequestQueries) -> None:
+        conn = self.connection
+        if conn.autocommit or conn.info.transaction_status != TransactionStatus.IDLE:
+            return
+
+        # Local to the transaction, which ends when the connection is returned
+        timeout = statement_timeout(queries.scope, settings.statement_timeouts)
+        if timeout:
+            super().execute(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+    def execute(self, query: Any, params: Optional[Any] = None, **kwargs: Any):
+        """Execute a query, record its time and log it if it is slow."""
+        queries = _request_queries.get()
+        if queries is not None:
+            self._set_statement_timeout(queries)
+            queries.cancels.add(self.connection.cancel_safe)
+
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(query, params, **kwargs)
+            failed = False
+            return result
+        finally:
+            if queries is not None:
+                queries.cancels.discard(self.connection.cancel_safe)
+
+            elapsed = (time.perf_counter() - started) * 1000
+            if isinstance(query, bytes):
+                query = query.decode()
+            elif not isinstance(query, str):
+                query = query.as_string(self.connection)
+
+            pool_metrics.record(f"DBQuery.{sql_function(query)}", elapsed)
+            entry = slow_queries.record(query, params, elapsed)
+            if entry is not None and not failed and slow_queries.sample():
+                slow_queries.explain_later(entry, query, params)
+
+
+# titiler-pgstac connection arguments, with the query timings
+DB_CONNECTION_KWARGS = {
+    "options": "-c search_path=pgstac,public -c application_name=pgstac",
+    "cursor_factory": TimedCursor,
+}
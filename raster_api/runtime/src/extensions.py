@@ -1,12 +1,15 @@
-"""Stac Viewer Extension."""
+"""Stac Viewer and COG Audit Extensions."""
 
 from dataclasses import dataclass
+from typing import List, Literal, Optional
 
 import jinja2
+from src.audit import mosaic_search, run, search_assets, to_csv, to_json
+from typing_extensions import Annotated
 
-from fastapi import Depends
+from fastapi import Depends, HTTPException, Query
 from starlette.requests import Request
-from starlette.responses import HTMLResponse
+from starlette.responses import HTMLResponse, Response
 from starlette.templating import Jinja2Templates
 from titiler.core.factory import BaseTilerFactory, FactoryExtension
 
@@ -41,3 +44,70 @@ class stacViewerExtension(FactoryExtension):
                 },
                 media_type="text/html",
             )
+
+
+@dataclass
+class cogAuditExtension(FactoryExtension):
+    """Add /audit endpoint to the TilerFactory."""
+
+    # Number of assets audited at a time, and maximum number of items
+    concurrency: int = 16
+    max_items: int = 100
+
+    def register(self, factory: BaseTilerFactory):
+        """Register endpoint to the tiler factory."""
+
+        @factory.router.get(
+            "/audit",
+            responses={
+                200: {"content": {"application/json": {}, "text/csv": {}}},
+            },
+        )
+        def cog_audit(
+            request: Request,
+            collection: Annotated[
+                Optional[str],
+                Query(description="STAC Collection ID"),
+            ] = None,
+            searchid: Annotated[
+                Optional[str],
+                Query(description="Mosaic search id"),
+            ] = None,
+            assets: Annotated[
+                Optional[List[str]],
+                Query(description="Asset keys, all the GeoTIFF assets by default"),
+            ] = None,
+            limit: Annotated[
+                int,
+                Query(description="Maximum number of items", ge=1),
+            ] = 100,
+            f: Annotated[
+                Literal["json", "csv"],
+                Query(description="Report format"),
+            ] = "json",
+            env=Depends(factory.environment_dependency),
+        ):
+            """Audit the COG layout of the assets of a collection or a mosaic search."""
+            if (collection is None) == (searchid is None):
+                raise HTTPException(
+                    status_code=400,
+                    detail="Exactly one of collection or searchid is required",
+                )
+
+            with request.app.state.dbpool.connection() as conn:
+                search = mosaic_search(conn, collection, searchid)
+                if search is None:
+                    raise HTTPException(
+                        status_code=404, detail=f"Mosaic {searchid} not found"
+                    )
+                items = list(
+                    search_assets(
+                        conn, search, assets or [], min(limit, self.max_items)
+                    )
+                )
+
+            results = run(items, env, self.concurrency)
+            if f == "csv":
+                return Response(to_csv(results), media_type="text/csv")
+
+            return to_json(results)
@@ -1,17 +1,133 @@
 """Observability utils"""
 
-from typing import Callable
+import re
+from typing import Callable, Dict
 
 from aws_lambda_powertools import Logger, Metrics, Tracer
 from aws_lambda_powertools.metrics import MetricUnit  # noqa: F401
+from psycopg_pool import ConnectionPool
 
 from fastapi import Request, Response
 from fastapi.routing import APIRoute
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 logger: Logger = Logger(service="raster-api", namespace="veda-backend")
 metrics: Metrics = Metrics(service="raster-api", namespace="veda-backend")
 tracer: Tracer = Tracer()
 
+# pgstac functions the query timings are reported by, other queries are `query`
+PGSTAC_FUNCTIONS = re.compile(
+    r"\b(geojsonsearch|geometrysearch|xyzsearch|search_query|search_fromhash"
+    r"|get_item|search)\s*\(",
+    re.IGNORECASE,
+)
+
+
+def sql_function(query: str) -> str:
+    """Name of the first pgstac function called by a query."""
+    match = PGSTAC_FUNCTIONS.search(query)
+    return match.group(1).lower() if match else "query"
+
+
+class PoolMetrics:
+    """Connection pool and query timings.
+
+    Every timing is emitted as a powertools metric and aggregated, since the
+    start of the process, for the debug endpoint.
+    """
+
+    def __init__(self):
+        """Initialize empty timings."""
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def record(self, name: str, ms: float) -> None:
+        """Record a timing, in milliseconds."""
+        metrics.add_metric(name=name, unit=MetricUnit.Milliseconds, value=ms)
+        timing = self.timings.setdefault(
+            name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+        )
+        timing["count"] += 1
+        timing["total_ms"] += ms
+        timing["max_ms"] = max(timing["max_ms"], ms)
+
+    def record_pool(self, pool: ConnectionPool) -> None:
+        """Record the pool usage since the previous call.
+
+        psycopg pools count the time spent waiting for and holding connections,
+        with a single request per Lambda invocation these are the times of the request.
+        """
+        stats = pool.pop_stats()
+        if stats.get("requests_num"):
+            self.record("DBPoolAcquireWait", stats.get("requests_wait_ms", 0))
+            self.record("DBPoolCheckout", stats.get("usage_ms", 0))
+
+        metrics.add_metric(
+            name="DBPoolSize", unit=MetricUnit.Count, value=stats["pool_size"]
+        )
+        metrics.add_metric(
+            name="DBPoolIdle", unit=MetricUnit.Count, value=stats["pool_available"]
+        )
+
+
+pool_metrics = PoolMetrics()
+
+
+def correlation_id(scope: Scope) -> str:
+    """Correlation id of a request, from its X-Correlation-Id header if provided."""
+    corr_id = Headers(scope=scope).get("x-correlation-id")
+    if not corr_id:
+        try:
+            # If empty, use request id from aws context
+            corr_id = scope["aws.context"].aws_request_id
+        except KeyError:
+            corr_id = "local"
+
+    return corr_id
+
+
+class CorrelationIdMiddleware:
+    """Add correlation ids to all requests and subsequent logs/traces.
+
+    A pure ASGI middleware: the response messages are passed through as they come,
+    with the `X-Correlation-Id` header added to the response start. The usage of
+    the database pool is recorded once the response is sent.
+    """
+
+    def __init__(self, app: ASGIApp):
+        """Wrap an ASGI application."""
+        self.app = app
+
+    @tracer.capture_method(capture_response=False)
+    async def call_next(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle the request, traced as the `call_next` subsegment."""
+        await self.app(scope, receive, send)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request with its correlation id."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        corr_id = correlation_id(scope)
+        # Add correlation id to logs
+        logger.set_correlation_id(corr_id)
+        # Add correlation id to traces
+        tracer.put_annotation(key="correlation_id", value=corr_id)
+
+        async def send_with_header(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # Return correlation header in response
+                MutableHeaders(scope=message)["X-Correlation-Id"] = corr_id
+            await send(message)
+
+        await self.call_next(scope, receive, send_with_header)
+
+        dbpool = getattr(scope["app"].state, "dbpool", None)
+        if dbpool is not None:
+            pool_metrics.record_pool(dbpool)
+        logger.info("Request completed")
+
 
 class LoggerRouteHandler(APIRoute):
     """Extension of base APIRoute to add context to log statements, as well as record usage metricss"""
@@ -0,0 +1,356 @@
+"""Overview sidecars of the COGs without internal overviews.
+
+Low zoom tiles, previews and statistics of a dataset without overviews read its
+full resolution. The first read of such a dataset builds, in the background, a
+decimated copy of it (a small COG, the overview "sidecar") in a local cache
+directory, later low resolution reads go to that copy.
+
+The sidecars of the items of a collection can be built beforehand:
+
+    python -m src.overviews --collection no2-monthly --processes 4
+"""
+
+import argparse
+import contextlib
+import hashlib
+import math
+import os
+import pathlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Type
+
+import attr
+import psycopg
+import rasterio
+import rasterio.shutil
+from affine import Affine
+from rasterio.enums import ColorInterp, MaskFlags, Resampling
+from rasterio.io import DatasetReader, MemoryFile
+from rio_tiler.io import BaseReader, Reader
+from src.config import ApiSettings
+from src.monitoring import logger
+
+from titiler.pgstac.reader import PgSTACReader
+
+# Media types, and extensions, of the assets with sidecars built by the CLI
+GEOTIFF_TYPES = ("image/tiff",)
+GEOTIFF_EXTENSIONS = (".tif", ".tiff")
+
+# Color interpretation of the RGB(A) datasets, with a RGB photometric
+RGB = (ColorInterp.red, ColorInterp.green, ColorInterp.blue)
+
+
+class OverviewCache:
+    """Overview sidecars, in `directory`, of the datasets larger than `min_size`.
+
+    A sidecar is `size` pixels on its longest side, resampled with `resampling`.
+    Sidecars are built one at a time, in a background thread, with the GDAL
+    configuration returned by `env`.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        min_size: int = 2048,
+        size: int = 1024,
+        resampling: str = "average",
+        env: Callable[[], Dict] = dict,
+    ):
+        """Initialize the cache, the directory is created by the first sidecar."""
+        self.directory = pathlib.Path(directory)
+        self.min_size = min_size
+        self.size = size
+        self.resampling = Resampling[resampling]
+        self.env = env
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._building: Set[pathlib.Path] = set()
+
+    def needs_overviews(self, dataset: DatasetReader) -> bool:
+        """Check if a dataset is too large to be read without overviews."""
+        return (
+            isinstance(dataset, DatasetReader)
+            and max(dataset.width, dataset.height) > self.min_size
+            and not dataset.overviews(1)
+        )
+
+    def factor(self, dataset: DatasetReader) -> int:
+        """Decimation factor of the sidecar of a dataset."""
+        return math.ceil(max(dataset.width, dataset.height) / self.size)
+
+    def path(self, input: str, dataset: DatasetReader) -> pathlib.Path:
+        """Sidecar of a dataset, a new file if the dataset is replaced."""
+        key = ":".join(
+            str(v)
+            for v in (
+                input,
+                dataset.width,
+                dataset.height,
+                tuple(dataset.transform),
+                dataset.crs,
+                dataset.count,
+                dataset.dtypes[0],
+                self.size,
+            )
+        )
+        return self.directory / f"{hashlib.sha1(key.encode()).hexdigest()}.tif"
+
+    def get(self, input: str, dataset: DatasetReader) -> Optional[pathlib.Path]:
+        """Return the sidecar of a dataset, scheduling its build if it does not exist."""
+        path = self.path(input, dataset)
+        if path.exists():
+            return path
+
+        if path not in self._building:
+            self._building.add(path)
+            self._executor.submit(self._build_later, input, path)
+
+        return None
+
+    def _build_later(self, input: str, path: pathlib.Path) -> None:
+        try:
+            with rasterio.Env(**self.env()):
+                self.build(input, path)
+        except Exception:
+            logger.exception(f"Failed to build the overview sidecar of {input}")
+        finally:
+            self._building.discard(path)
+
+    def build(self, input: str, path: Optional[pathlib.Path] = None) -> pathlib.Path:
+        """Build the sidecar of a dataset, in the current GDAL environment."""
+        with rasterio.open(input) as src:
+            path = path or self.path(input, src)
+            if path.exists():
+                return path
+
+            factor = self.factor(src)
+            width = math.ceil(src.width / factor)
+            height = math.ceil(src.height / factor)
+            data = src.read(
+                out_shape=(src.count, height, width), resampling=self.resampling
+            )
+
+            profile = {
+                "driver": "GTiff",
+                "width": width,
+                "height": height,
+                "count": src.count,
+                "dtype": src.dtypes[0],
+                "crs": src.crs,
+                "transform": src.transform
+                * Affine.scale(src.width / width, src.height / height),
+                "nodata": src.nodata,
+            }
+            if src.colorinterp[:3] == RGB:
+                profile["photometric"] = "RGB"
+            # Only the per-dataset masks, the nodata value and alpha band are kept
+            mask = None
+            if src.nodata is None and src.mask_flag_enums[0] == [MaskFlags.per_dataset]:
+                mask = src.dataset_mask(out_shape=(height, width))
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with MemoryFile() as memfile:
+                with memfile.open(**profile) as dst:
+                    # Before the data, GDAL cannot define an alpha band afterwards
+                    dst.colorinterp = src.colorinterp
+                    dst.write(data)
+                    if mask is not None:
+                        dst.write_mask(mask)
+                    dst.scales = src.scales
+                    dst.offsets = src.offsets
+                    dst.descriptions = src.descriptions
+                    dst.update_tags(**src.tags())
+
+                # Written to a temporary file first, readers only see complete sidecars
+                fd, tmp = tempfile.mkstemp(suffix=".tif", dir=self.directory)
+                os.close(fd)
+                try:
+                    with memfile.open() as mem:
+                        rasterio.shutil.copy(mem, tmp, driver="COG", compress="DEFLATE")
+                    os.replace(tmp, path)
+                finally:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+
+        logger.info(f"Built the overview sidecar of {input} ({factor}x)")
+        return path
+
+
+settings = ApiSettings()
+overview_cache = (
+    OverviewCache(
+        settings.overview_cache_dir,
+        min_size=settings.overview_min_size,
+        size=settings.overview_size,
+        resampling=settings.overview_resampling,
+        env=settings.get_gdal_config,
+    )
+    if settings.overview_cache_dir
+    else None
+)
+
+
+@attr.s
+class OverviewReader(Reader):
+    """COG reader, reading from the overview sidecar of the datasets without overviews.
+
+    The tiles at the zooms of the sidecar resolution, or below, and the previews
+    (and statistics) no larger than the sidecar are read from the sidecar once it
+    is built.
+    """
+
+    _sidecar: Optional[pathlib.Path] = attr.ib(init=False, default=None)
+    _factor: int = attr.ib(init=False, default=1)
+    _sidecar_dataset: Optional[DatasetReader] = attr.ib(init=False, default=None)
+
+    # Opened by the Reader, swapped with the sidecar while reading from it
+    dataset: DatasetReader
+
+    def __attrs_post_init__(self):
+        """Open the dataset, and look for its sidecar if it has no overviews."""
+        super().__attrs_post_init__()
+        if overview_cache is not None and overview_cache.needs_overviews(self.dataset):
+            self._sidecar = overview_cache.get(self.input, self.dataset)
+            self._factor = overview_cache.factor(self.dataset)
+
+    @contextlib.contextmanager
+    def _from_sidecar(self) -> Iterator[None]:
+        """Read from the sidecar within the context, opening it once."""
+        if self._sidecar_dataset is None:
+            self._sidecar_dataset = self._ctx_stack.enter_context(
+                rasterio.open(self._sidecar)
+            )
+        dataset = self.dataset
+        self.dataset = self._sidecar_dataset
+        try:
+            yield
+        finally:
+            self.dataset = dataset
+
+    def tile(self, tile_x: int, tile_y: int, tile_z: int, **kwargs: Any):
+        """Read a Web Map tile, from the sidecar at its zooms."""
+        # The sidecar resolution is at least `factor` times coarser, tiles are read
+        # from it only at the zooms where it is not upsampled
+        if self._sidecar is not None and tile_z <= self.maxzoom - math.ceil(
+            math.log2(self._factor)
+        ):
+            with self._from_sidecar():
+                return super().tile(tile_x, tile_y, tile_z, **kwargs)
+
+        return super().tile(tile_x, tile_y, tile_z, **kwargs)
+
+    def read(
+        self,
+        *args: Any,
+        max_size: Optional[int] = None,
+        height: Optional[int] = None,
+        width: Optional[int] = None,
+        **kwargs: Any,
+    ):
+        """Read the dataset, from the sidecar for outputs no larger than it."""
+        kwargs.update(max_size=max_size, height=height, width=width)
+        size = max(max_size or 0, height or 0, width or 0)
+        if (
+            self._sidecar is not None
+            and "window" not in kwargs
+            and 0 < size <= overview_cache.size  # type: ignore
+        ):
+            with self._from_sidecar():
+                return super().read(*args, **kwargs)
+
+        return super().read(*args, **kwargs)
+
+
+@attr.s
+class OverviewPgSTACReader(PgSTACReader):
+    """PgSTAC item reader, reading its assets with the `OverviewReader`."""
+
+    reader: Type[BaseReader] = attr.ib(default=OverviewReader)
+
+
+ASSETS_SQL = """
+    SELECT id, content->'assets' FROM items WHERE collection = %s ORDER BY id;
+"""
+
+parser = argparse.ArgumentParser(
+    description="Build the overview sidecars of the COGs of a collection"
+)
+parser.add_argument(
+    "--collection",
+    dest="collection",
+    type=str,
+    required=True,
+    help="Collection id",
+)
+parser.add_argument(
+    "--asset",
+    dest="assets",
+    type=str,
+    action="append",
+    default=[],
+    help="Asset key (repeat for each asset), all the GeoTIFF assets by default",
+)
+parser.add_argument(
+    "--processes",
+    dest="processes",
+    type=int,
+    default=os.cpu_count(),
+    help="Number of build processes",
+)
+
+
+def collection_assets(collection: str, keys: List[str]) -> Iterator[Tuple[str, str]]:
+    """Item id and href of the GeoTIFF assets of a collection."""
+    url = str(settings.load_postgres_settings().database_url)
+    with psycopg.connect(url) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(ASSETS_SQL, (collection,))
+            for item, assets in cursor:
+                for key, asset in (assets or {}).items():
+                    if keys and key not in keys:
+                        continue
+                    href = asset.get("href", "")
+                    media_type = asset.get("type", "").split(";")[0].strip()
+                    if (
+                        keys
+                        or media_type in GEOTIFF_TYPES
+                        or (
+                            not media_type and href.lower().endswith(GEOTIFF_EXTENSIONS)
+                        )
+                    ):
+                        yield item, href
+
+
+def build(href: str) -> str:
+    """Build the sidecar of a dataset if it needs one, returns what was done."""
+    with rasterio.Env(**settings.get_gdal_config()):
+        with rasterio.open(href) as src:
+            if not overview_cache.needs_overviews(src):  # type: ignore
+                return "skipped"
+        overview_cache.build(href)  # type: ignore
+    return "built"
+
+
+def main(args: argparse.Namespace) -> None:
+    """Build the sidecars."""
+    if overview_cache is None:
+        parser.error("VEDA_RASTER_OVERVIEW_CACHE_DIR is required")
+
+    assets = list(collection_assets(args.collection, args.assets))
+    print(f"Building the overview sidecars of {len(assets)} assets")
+
+    counts: Dict[str, int] = {"built": 0, "skipped": 0, "failed": 0}
+    with ProcessPoolExecutor(max_workers=args.processes) as executor:
+        futures = {executor.submit(build, href): (item, href) for item, href in assets}
+        for future, (item, href) in futures.items():
+            try:
+                counts[future.result()] += 1
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"{item}: {href} failed: {e}")
+
+    print(", ".join(f"{count} {result}" for result, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
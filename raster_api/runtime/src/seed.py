@@ -0,0 +1,238 @@
+"""Tile pyramid seeding.
+
+Renders the tiles of a mosaic, over a bbox and a zoom range, through the mosaic
+tile endpoint of the API, in-process, and writes them to the tile store the API
+serves them from (VEDA_RASTER_TILE_STORE):
+
+    python -m src.seed --collection no2-monthly --bbox -180,-90,180,90 --zooms 0-4 \
+        --param assets=cog_default --param rescale=0,1 \
+        --param colormap_name=rdbu_r --store s3://bucket/tiles
+
+The seeded tiles are served for the tile URLs listed by the mosaic tilejson when it
+is requested with the same render parameters (and tile format and scale).
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import morecantile
+from src.app import app, tile_versions
+from src.tilecache import TileStore, manifest_key, tile_key
+
+from starlette.testclient import TestClient
+
+parser = argparse.ArgumentParser(description="Seed the tiles of a mosaic")
+mosaic = parser.add_mutually_exclusive_group(required=True)
+mosaic.add_argument(
+    "--searchid",
+    dest="searchid",
+    type=str,
+    help="Mosaic search id (hash), as used by the dashboard",
+)
+mosaic.add_argument(
+    "--collection",
+    dest="collection",
+    type=str,
+    help="Collection id, its mosaic search is registered",
+)
+parser.add_argument(
+    "--bbox",
+    dest="bbox",
+    type=str,
+    default="-180,-85.05,180,85.05",
+    help="west,south,east,north bounds, in degrees",
+)
+parser.add_argument(
+    "--zooms",
+    dest="zooms",
+    type=str,
+    required=True,
+    help="Zoom range, as min-max",
+)
+parser.add_argument(
+    "--tms",
+    dest="tms",
+    type=str,
+    default="WebMercatorQuad",
+    help="TileMatrixSet identifier",
+)
+parser.add_argument(
+    "--format",
+    dest="format",
+    type=str,
+    default=None,
+    help="Tile format, as the tilejson tile_format parameter",
+)
+parser.add_argument(
+    "--scale",
+    dest="scale",
+    type=int,
+    default=None,
+    help="Tile scale, as the tilejson tile_scale parameter",
+)
+parser.add_argument(
+    "--param",
+    dest="params",
+    type=str,
+    action="append",
+    default=[],
+    help="Render parameter, as key=value (repeat for each parameter)",
+)
+parser.add_argument(
+    "--store",
+    dest="store",
+    type=str,
+    default=os.environ.get("VEDA_RASTER_TILE_STORE"),
+    help="Directory or s3://bucket/prefix of the tile store",
+)
+parser.add_argument(
+    "--processes",
+    dest="processes",
+    type=int,
+    default=os.cpu_count(),
+    help="Number of rendering processes",
+)
+parser.add_argument(
+    "--chunk-size",
+    dest="chunk_size",
+    type=int,
+    default=32,
+    help="Number of tiles rendered by a process at a time",
+)
+
+# Results of the tile requests
+RENDERED, CACHED, EMPTY, FAILED = "rendered", "cached", "empty", "failed"
+
+# The application and store of a rendering process
+_client: Optional[TestClient] = None
+_store: Optional[TileStore] = None
+
+
+def tile_path(
+    searchid: str,
+    tms: str,
+    tile: morecantile.Tile,
+    scale: Optional[int],
+    format: Optional[str],
+) -> str:
+    """Path of a tile, as listed by the mosaic tilejson."""
+    path = f"/mosaic/{searchid}/tiles/{tms}/{tile.z}/{tile.x}/{tile.y}"
+    if scale:
+        path += f"@{scale}x"
+    if format:
+        path += f".{format}"
+    return path
+
+
+def start_worker(store: str) -> None:
+    """Open the application (and its connection pool) of a rendering process."""
+    global _client, _store
+    _client = TestClient(app)
+    _client.__enter__()
+    _store = TileStore(store)
+
+
+def render(
+    paths: List[str], params: List[Tuple[str, str]], version: str
+) -> Dict[str, int]:
+    """Render tiles and write them to the store, returns the count of each result."""
+    counts = dict.fromkeys([RENDERED, CACHED, EMPTY, FAILED], 0)
+    for path in paths:
+        response = _client.get(  # type: ignore
+            path, params=params, headers={"Accept-Encoding": "identity"}
+        )
+        if response.status_code == 200 and response.headers.get("x-tile-cache"):
+            counts[CACHED] += 1
+        elif response.status_code == 200:
+            _store.put(  # type: ignore
+                tile_key(path, params, version),
+                response.content,
+                response.headers["content-type"],
+            )
+            counts[RENDERED] += 1
+        elif response.status_code in (204, 404):
+            # Outside of the mosaic bounds, or without any asset
+            counts[EMPTY] += 1
+        else:
+            counts[FAILED] += 1
+
+    return counts
+
+
+def chunks(iterable: Iterator, size: int) -> Iterator[List]:
+    """Split an iterable into lists of `size` elements."""
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def main(args: argparse.Namespace) -> None:
+    """Seed the tiles."""
+    if not args.store:
+        parser.error("--store, or VEDA_RASTER_TILE_STORE, is required")
+
+    params: List[Tuple[str, str]] = []
+    for param in args.params:
+        key, sep, value = param.partition("=")
+        if not key or not sep:
+            parser.error(f"--param {param} is not a key=value parameter")
+        params.append((key, value))
+    minzoom, maxzoom = (int(z) for z in args.zooms.split("-"))
+    west, south, east, north = (float(v) for v in args.bbox.split(","))
+
+    with TestClient(app) as client:
+        searchid = args.searchid
+        if searchid is None:
+            response = client.post(
+                "/mosaic/register", json={"collections": [args.collection]}
+            )
+            response.raise_for_status()
+            searchid = response.json()["searchid"]
+
+        version = tile_versions.query(app.state.dbpool, ("search", searchid))
+        if version is None:
+            parser.error(f"Mosaic {searchid} not found")
+
+    tms = morecantile.tms.get(args.tms)
+    tiles = tms.tiles(west, south, east, north, zooms=list(range(minzoom, maxzoom + 1)))
+    paths = (tile_path(searchid, args.tms, t, args.scale, args.format) for t in tiles)
+    print(f"Seeding mosaic {searchid} (version {version}) to {args.store}")
+
+    # The API only looks up the tiles of the seeded mosaic versions
+    TileStore(args.store).put(manifest_key(searchid, version), b"", "text/plain")
+
+    totals = dict.fromkeys([RENDERED, CACHED, EMPTY, FAILED], 0)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=args.processes,
+        # The connection pool threads do not survive a fork
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=start_worker,
+        initargs=(args.store,),
+    ) as executor:
+        futures = [
+            executor.submit(render, chunk, params, version)
+            for chunk in chunks(paths, args.chunk_size)
+        ]
+        for future in futures:
+            for result, count in future.result().items():
+                totals[result] += count
+            done = sum(totals.values())
+            elapsed = time.perf_counter() - started
+            print(f"{done} tiles, {done / elapsed:.1f} tiles/s", end="\r")
+
+    elapsed = time.perf_counter() - started
+    done = sum(totals.values())
+    print(
+        f"{done} tiles in {elapsed:.1f}s ({done / elapsed:.1f} tiles/s): "
+        + ", ".join(f"{count} {result}" for result, count in totals.items())
+    )
+
+
+if __name__ == "__main__":
+    main(parser.parse_args())
@@ -0,0 +1,190 @@
+"""Slow query log."""
+
+import random
+import re
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+import orjson
+import psycopg
+from psycopg_pool import ConnectionPool
+from src.config import ApiSettings
+from src.monitoring import logger, sql_function
+
+# Arguments longer than this are truncated in the log
+MAX_ARGUMENT_LENGTH = 2000
+
+# pgstac mosaic functions, explained through the items query they run
+MOSAIC_FUNCTIONS = {"geojsonsearch", "geometrysearch", "xyzsearch"}
+# Items scanned by the mosaic functions, pgstac's default scan limit
+MOSAIC_SCAN_LIMIT = 10000
+# Mosaic search ids (hashes)
+SEARCH_HASH = re.compile(r"^[0-9a-f]{32}$")
+
+
+def normalize_argument(arg: Any) -> Any:
+    """Normalize a query argument for the log.
+
+    JSON objects (pgstac searches) are parsed, with sorted keys, so that the same
+    search logs the same way every time.
+    """
+    if not isinstance(arg, str):
+        return arg
+
+    if arg.startswith("{") and len(arg) <= MAX_ARGUMENT_LENGTH:
+        try:
+            value = orjson.loads(arg)
+        except orjson.JSONDecodeError:
+            return arg
+
+        if isinstance(value, dict):
+            return orjson.loads(orjson.dumps(value, option=orjson.OPT_SORT_KEYS))
+
+    if len(arg) > MAX_ARGUMENT_LENGTH:
+        return arg[:MAX_ARGUMENT_LENGTH] + "..."
+
+    return arg
+
+
+class SlowQueryLog:
+    """Queries slower than `threshold_ms`, kept in a bounded in-memory ring buffer.
+
+    Slow queries are logged and a `explain_rate` fraction of them is explained
+    (`EXPLAIN (ANALYZE, BUFFERS)`) in a background thread, on a separate connection
+    of `pool` and within a transaction which is rolled back. The pgstac mosaic
+    searches are explained through the items query built from the where and order
+    by clauses of their search, the plan of the other pgstac function calls would
+    be a single function scan and they are logged without a plan.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float,
+        explain_rate: float,
+        size: int,
+        explain_timeout_ms: int = 30000,
+    ):
+        """Initialize an empty log."""
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.explain_timeout_ms = explain_timeout_ms
+        self.entries: Deque[Dict[str, Any]] = deque(maxlen=size)
+        # Set once the titiler-pgstac pool is created
+        self.pool: Optional[ConnectionPool] = None
+
+    def record(self, query: str, params: Any, ms: float) -> Optional[Dict[str, Any]]:
+        """Log the query if it is slow, returns the log entry."""
+        if self.threshold_ms <= 0 or ms < self.threshold_ms:
+            return None
+
+        args: Union[Dict[str, Any], List[Any]]
+        if isinstance(params, dict):
+            args = {k: normalize_argument(v) for k, v in params.items()}
+        else:
+            args = [normalize_argument(v) for v in params or []]
+
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "function": sql_function(query),
+            "ms": round(ms, 3),
+            "query": " ".join(query.split()),
+            "args": args,
+            "plan": None,
+        }
+        self.entries.append(entry)
+        logger.warning("Slow query", extra={"slow_query": entry})
+        return entry
+
+    def sample(self) -> bool:
+        """Check if a slow query should be explained."""
+        return self.pool is not None and random.random() < self.explain_rate
+
+    def _items_query(self, cursor: Any, params: Any) -> Optional[Tuple[str, List]]:
+        """Items query of a mosaic search function, from its search and geometry."""
+        values = list(params.values() if isinstance(params, dict) else params or [])
+        searchid = next(
+            (v for v in values if isinstance(v, str) and SEARCH_HASH.match(v)), None
+        )
+        if searchid is None:
+            return None
+
+        cursor.execute(
+            "SELECT _where, orderby FROM searches WHERE hash = %s", (searchid,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+        # Literal percent signs (LIKE patterns), the query is run with arguments
+        where, orderby = (clause.replace("%", "%%") for clause in row)
+        args: List[Any] = []
+        # The GeoJSON geometry of `geojsonsearch`, or the tile of `xyzsearch`
+        geometry = next(
+            (v for v in values if isinstance(v, str) and '"coordinates"' in v), None
+        )
+        tile = [v for v in values if isinstance(v, int) and not isinstance(v, bool)]
+        if geometry is not None:
+            where = f"{where} AND ST_Intersects(geometry, ST_GeomFromGeoJSON(%s))"
+            args.append(geometry)
+        elif len(tile) >= 3:
+            where = (
+                f"{where} AND ST_Intersects("
+                "geometry, ST_Transform(tileenvelope(%s, %s, %s), 4326))"
+            )
+            args.extend([tile[2], tile[0], tile[1]])
+
+        query = (
+            f"SELECT * FROM items WHERE {where} "
+            f"ORDER BY {orderby} LIMIT {MOSAIC_SCAN_LIMIT}"
+        )
+        return query, args
+
+    def explain(self, entry: Dict[str, Any], query: str, params: Any) -> None:
+        """Add the plan of a slow query to its log entry."""
+        try:
+            with self.pool.connection(self.explain_timeout_ms / 1000) as conn:  # type: ignore
+                with conn.transaction(force_rollback=True):
+                    # A plain cursor, the explain is not timed nor logged
+                    with psycopg.Cursor(conn) as cursor:
+                        cursor.execute(
+                            f"SET LOCAL statement_timeout = {int(self.explain_timeout_ms)}"
+                        )
+                        if entry["function"] in MOSAIC_FUNCTIONS:
+                            items_query = self._items_query(cursor, params)
+                            if items_query is None:
+                                return
+                            query, params = items_query
+
+                        cursor.execute(
+                            f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", params
+                        )
+                        plan = cursor.fetchone()[0]  # type: ignore
+        except (psycopg.Error, OSError) as e:
+            entry["plan"] = {"error": str(e)}
+            return
+
+        entry["plan"] = plan
+        logger.warning("Slow query plan", extra={"slow_query": entry})
+
+    def explain_later(self, entry: Dict[str, Any], query: str, params: Any) -> None:
+        """Explain a slow query in a background thread."""
+        if entry["function"] != "query" and entry["function"] not in MOSAIC_FUNCTIONS:
+            return
+
+        threading.Thread(
+            target=self.explain, args=(entry, query, params), daemon=True
+        ).start()
+
+    def recent(self) -> List[Dict[str, Any]]:
+        """Return the log entries, most recent first."""
+        return list(reversed(self.entries))
+
+
+settings = ApiSettings()
+slow_queries = SlowQueryLog(
+    threshold_ms=settings.slow_query_ms,
+    explain_rate=settings.slow_query_explain_rate,
+    size=settings.slow_query_log_size,
+)
@@ -0,0 +1,165 @@
+"""Seeded tiles store, served as a cache tier of the mosaic tiles."""
+
+import hashlib
+import mimetypes
+import pathlib
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import boto3
+from botocore.exceptions import ClientError
+from src.versioning import MOSAIC_TILE, VERSION_PARAMETER, TileVersions
+
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+def tile_key(path: str, params: List[Tuple[str, str]], version: str) -> str:
+    """Store key of a tile, from its request path and query and its mosaic version.
+
+    The version is part of the key, tiles seeded before a data update are not
+    served anymore. The query, without the version parameter, is hashed.
+    """
+    query = urlencode(sorted((k, v) for k, v in params if k != VERSION_PARAMETER))
+    query_hash = hashlib.sha1(query.encode()).hexdigest()[:16]
+    return f"{path.strip('/')}/{version}/{query_hash}"
+
+
+def manifest_key(searchid: str, version: str) -> str:
+    """Store key of the manifest of a mosaic version, written when it is seeded."""
+    return f"mosaic/{searchid}/seeded/{version}"
+
+
+class TileStore:
+    """Rendered tiles, in a directory or under a `s3://bucket/prefix` URL."""
+
+    def __init__(self, url: str):
+        """Initialize the store, the directory is created by the first tile."""
+        self.url = url
+        parsed = urlparse(url)
+        self.bucket: Optional[str] = None
+        if parsed.scheme == "s3":
+            self.bucket = parsed.netloc
+            self.prefix = parsed.path.strip("/")
+            self.s3: Any = boto3.client("s3")
+        else:
+            self.root = pathlib.Path(url)
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Return the body and media type of a tile, None if it is not stored."""
+        if self.bucket is not None:
+            try:
+                obj = self.s3.get_object(Bucket=self.bucket, Key=self._object_key(key))
+            except ClientError as e:
+                if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                    return None
+                raise
+            return obj["Body"].read(), obj["ContentType"]
+
+        # The file extension carries the media type
+        path = self.root / key
+        for file in path.parent.glob(f"{path.name}.*") if path.parent.is_dir() else []:
+            media_type, _ = mimetypes.guess_type(file.name)
+            return file.read_bytes(), media_type or "application/octet-stream"
+
+        return None
+
+    def put(self, key: str, body: bytes, media_type: str) -> None:
+        """Store a tile."""
+        if self.bucket is not None:
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=self._object_key(key),
+                Body=body,
+                ContentType=media_type,
+            )
+            return
+
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        extension = mimetypes.guess_extension(media_type.split(";")[0]) or ""
+        path.with_name(path.name + extension).write_bytes(body)
+
+
+class SeededTileMiddleware:
+    """Serve the mosaic tiles found in the store of seeded tiles.
+
+    Tiles are looked up with the current version of their mosaic, if this version
+    was seeded, other requests and store misses go to the application. Whether a
+    mosaic version was seeded (its manifest is stored) is cached for `ttl`
+    seconds, the tiles of the mosaics never seeded are not looked up.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        store: TileStore,
+        versions: TileVersions,
+        ttl: float = 300,
+        max_size: int = 10000,
+    ):
+        """Wrap an ASGI application."""
+        self.app = app
+        self.store = store
+        self.versions = versions
+        self.ttl = ttl
+        self.max_size = max_size
+        self._seeded: Dict[Tuple[str, str], Tuple[bool, float]] = {}
+
+    async def seeded(self, searchid: str, version: str) -> bool:
+        """Check if a mosaic version was seeded."""
+        key = (searchid, version)
+        cached = self._seeded.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+
+        seeded = (
+            await run_in_threadpool(self.store.get, manifest_key(*key))
+        ) is not None
+        now = time.monotonic()
+        if len(self._seeded) >= self.max_size:
+            # Drop the expired entries, or all of them if none has expired
+            self._seeded = {k: v for k, v in self._seeded.items() if v[1] > now}
+            if len(self._seeded) >= self.max_size:
+                self._seeded.clear()
+        self._seeded[key] = (seeded, now + self.ttl)
+        return seeded
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request, from the store if the tile was seeded."""
+        match = MOSAIC_TILE.search(scope["path"]) if scope["type"] == "http" else None
+        pool = getattr(getattr(scope.get("app"), "state", None), "dbpool", None)
+        if match is None or scope["method"] != "GET" or pool is None:
+            await self.app(scope, receive, send)
+            return
+
+        searchid = match.group("searchid")
+        version = await self.versions.get(pool, ("search", searchid))
+        params = parse_qsl(scope["query_string"].decode("latin-1"))
+        tile = None
+        if version is not None and await self.seeded(searchid, version):
+            # The path from the mosaic prefix, whatever the root path of the API
+            key = tile_key(scope["path"][match.start() :], params, version)
+            tile = await run_in_threadpool(self.store.get, key)
+
+        if tile is None:
+            await self.app(scope, receive, send)
+            return
+
+        body, media_type = tile
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", media_type.encode("latin-1")),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"x-tile-cache", b"hit"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,167 @@
+"""Content versioned tile URLs."""
+
+import hashlib
+import re
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Query parameter carrying the content version of the tile URLs
+VERSION_PARAMETER = "v"
+
+# Documents listing tile URLs, which carry the version of their query parameters
+MOSAIC_TILEJSON = re.compile(
+    r"/mosaic/(?P<searchid>[^/]+)/(?:[^/]+/)?(?:tilejson\.json|WMTSCapabilities\.xml)$"
+)
+STAC_TILEJSON = re.compile(
+    r"/stac/(?:[^/]+/)?(?:tilejson\.json|WMTSCapabilities\.xml)$"
+)
+
+MOSAIC_TILE = re.compile(r"/mosaic/(?P<searchid>[^/]+)/tiles/")
+STAC_TILE = re.compile(r"/stac/tiles/")
+
+# A search changes with its hash, and its items with the last update of the
+# partitions of its collections (of all the collections if it does not filter them)
+SEARCH_VERSION_SQL = """
+    SELECT s.hash, (
+        SELECT max(p.last_updated) FROM partitions_view p
+        WHERE NOT s.search ? 'collections'
+        OR p.collection IN (SELECT jsonb_array_elements_text(s.search->'collections'))
+    )
+    FROM searches s WHERE s.hash = %s;
+"""
+
+ITEM_VERSION_SQL = """
+    SELECT md5(content::text), NULL FROM items WHERE collection = %s AND id = %s;
+"""
+
+
+class TileVersions:
+    """Content versions of the mosaics and items, cached for `ttl` seconds.
+
+    Mosaics are identified by (`search`, hash) and items by (`item`, collection,
+    id) keys.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10000):
+        """Initialize an empty cache."""
+        self.ttl = ttl
+        self.max_size = max_size
+        self._versions: Dict[Tuple[str, ...], Tuple[Optional[str], float]] = {}
+
+    def query(self, pool: Any, key: Tuple[str, ...]) -> Optional[str]:
+        """Read the version of a mosaic or an item from the database."""
+        sql = SEARCH_VERSION_SQL if key[0] == "search" else ITEM_VERSION_SQL
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, key[1:])
+                row = cursor.fetchone()
+
+        if row is None:
+            return None
+
+        content, updated = row
+        return hashlib.sha1(f"{content}:{updated}".encode()).hexdigest()[:16]
+
+    async def get(self, pool: Any, key: Tuple[str, ...]) -> Optional[str]:
+        """Return the version of a mosaic or an item, None if it does not exist."""
+        cached = self._versions.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+
+        version = await run_in_threadpool(self.query, pool, key)
+        now = time.monotonic()
+        if len(self._versions) >= self.max_size:
+            # Drop the expired versions, or all of them if none has expired
+            self._versions = {k: v for k, v in self._versions.items() if v[1] > now}
+            if len(self._versions) >= self.max_size:
+                self._versions.clear()
+        self._versions[key] = (version, now + self.ttl)
+        return version
+
+
+def version_key(
+    path: str, query: Dict[str, str], tilejson: bool
+) -> Optional[Tuple[str, ...]]:
+    """Versioned mosaic or item of a tilejson, or tile, request."""
+    mosaic, stac = (
+        (MOSAIC_TILEJSON, STAC_TILEJSON) if tilejson else (MOSAIC_TILE, STAC_TILE)
+    )
+    match = mosaic.search(path)
+    if match:
+        return ("search", match.group("searchid"))
+
+    if stac.search(path) and "collection" in query and "item" in query:
+        return ("item", query["collection"], query["item"])
+
+    return None
+
+
+class TileVersionMiddleware:
+    """Content versioned, immutable, tile URLs.
+
+    The tile URLs of tilejson documents (and WMTS capabilities) of mosaics and STAC
+    items carry the content version (`v` parameter, added to the request) of the
+    mosaic or item. Tiles requested with the current version are served with the
+    immutable `cachecontrol`, a data update changes the version of the new URLs.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        versions: TileVersions,
+        cachecontrol: str = "public, max-age=31536000, immutable",
+    ):
+        """Wrap an ASGI application."""
+        self.app = app
+        self.versions = versions
+        self.cachecontrol = cachecontrol
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Version the tilejson documents and cache the versioned tiles."""
+        pool = getattr(scope.get("app", None), "state", None)
+        pool = getattr(pool, "dbpool", None)
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("GET", "HEAD")
+            or pool is None
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        params = parse_qsl(
+            scope["query_string"].decode("latin-1"), keep_blank_values=True
+        )
+        query = dict(params)
+
+        key = version_key(path, query, tilejson=True)
+        if key is not None:
+            version = await self.versions.get(pool, key)
+            if version is not None:
+                params = [(k, v) for k, v in params if k != VERSION_PARAMETER]
+                params.append((VERSION_PARAMETER, version))
+                scope = {**scope, "query_string": urlencode(params).encode("latin-1")}
+            await self.app(scope, receive, send)
+            return
+
+        key = version_key(path, query, tilejson=False)
+        requested = query.get(VERSION_PARAMETER)
+        if (
+            key is None
+            or not requested
+            or requested != await self.versions.get(pool, key)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_immutable(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                MutableHeaders(scope=message)["Cache-Control"] = self.cachecontrol
+            await send(message)
+
+        await self.app(scope, receive, send_immutable)
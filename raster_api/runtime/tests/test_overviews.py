@@ -0,0 +1,64 @@
+"""test the overview sidecars."""
+
+import numpy as np
+import rasterio
+from rasterio.enums import ColorInterp
+from rasterio.transform import from_origin
+from src.overviews import OverviewCache
+
+RGBA = (ColorInterp.red, ColorInterp.green, ColorInterp.blue, ColorInterp.alpha)
+
+
+def write_fixture(path, count, alpha=False, mask=False):
+    """Write a 600x600 GeoTIFF, transparent (or masked) on its left half."""
+    data = np.full((count, 600, 600), 100, dtype="uint8")
+    if alpha:
+        data[-1] = 255
+        data[-1, :, :300] = 0
+
+    profile = {
+        "driver": "GTiff",
+        "width": 600,
+        "height": 600,
+        "count": count,
+        "dtype": "uint8",
+        "crs": "EPSG:4326",
+        "transform": from_origin(0, 6, 0.01, 0.01),
+    }
+    if alpha:
+        profile["photometric"] = "RGB"
+    with rasterio.open(path, "w", **profile) as dst:
+        if alpha:
+            dst.colorinterp = RGBA
+        dst.write(data)
+        if mask:
+            dataset_mask = np.full((600, 600), 255, dtype="uint8")
+            dataset_mask[:, :300] = 0
+            dst.write_mask(dataset_mask)
+
+
+def test_sidecar_rgba(tmp_path):
+    """The alpha band of the dataset is the alpha band of its sidecar."""
+    input = str(tmp_path / "rgba.tif")
+    write_fixture(input, 4, alpha=True)
+
+    sidecar = OverviewCache(str(tmp_path / "overviews"), size=100).build(input)
+    with rasterio.open(sidecar) as src:
+        assert (src.width, src.height) == (100, 100)
+        assert src.colorinterp == RGBA
+        mask = src.dataset_mask()
+        assert not mask[:, :45].any()
+        assert mask[:, 55:].all()
+
+
+def test_sidecar_mask(tmp_path):
+    """The per-dataset mask of the dataset is the mask of its sidecar."""
+    input = str(tmp_path / "masked.tif")
+    write_fixture(input, 1, mask=True)
+
+    sidecar = OverviewCache(str(tmp_path / "overviews"), size=100).build(input)
+    with rasterio.open(sidecar) as src:
+        assert src.count == 1
+        mask = src.dataset_mask()
+        assert not mask[:, :45].any()
+        assert mask[:, 55:].all()
@@ -20,6 +20,7 @@ extra_reqs = {
         "httpx==0.23.3",
         "pypgstac==0.7.4",
         "psycopg[binary, pool]",
+        "pyarrow",
     ],
 }
 
@@ -18,9 +18,15 @@ inst_reqs = [
     "pygeoif<=0.8",  # newest release (1.0+ / 09-22-2022) breaks a number of other geo libs
     "aws-lambda-powertools>=1.18.0",
     "aws_xray_sdk>=2.6.0,<3",
+    # Connection.query_logger
+    "asyncpg>=0.29",
+    # Shared middlewares, installed from common/runtime
+    "veda.common",
 ]
 
 extra_reqs = {
+    "geoparquet": ["pyarrow>=14.0", "shapely>=2.0"],
+    "transactions": ["pypgstac[psycopg]==0.7.4"],
     "test": ["pytest", "pytest-cov", "pytest-asyncio", "requests"],
 }
 
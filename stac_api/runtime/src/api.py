@@ -4,11 +4,24 @@ from typing import List
 
 import attr
 
+from fastapi import Query
 from stac_fastapi.api.app import StacApi
+from stac_fastapi.api.models import CollectionUri, EmptyRequest, GeoJSONResponse
 from stac_fastapi.api.routes import create_async_endpoint
+from stac_fastapi.types.stac import Collection, Collections
+from starlette.requests import Request
+from starlette.responses import Response
 
-from .core import VedaCrudClient
-from .search import CollectionSearchGet, CollectionSearchPost
+from .core import GRID_MAX_ZOOM, MVT_MEDIA_TYPE, VedaCrudClient
+from .search import (
+    BulkItemsGet,
+    BulkItemsPost,
+    CollectionSearchGet,
+    CollectionSearchPost,
+    CollectionTileGet,
+    DatetimeHistogramGet,
+    SearchTileGet,
+)
 
 
 class VedaStacApi(StacApi):
@@ -59,3 +72,152 @@ class VedaStacApi(StacApi):
             ),
             include_in_schema=False,
         )
+
+    def register_get_collections(self):
+        """Register get collections endpoint (GET /collections), served from the collections snapshot.
+        Returns:
+            None
+        """
+        self.router.add_api_route(
+            name="Get Collections",
+            path="/collections",
+            response_model=Collections
+            if self.settings.enable_response_models
+            else None,
+            response_class=self.response_class,
+            response_model_exclude_unset=True,
+            response_model_exclude_none=True,
+            methods=["GET"],
+            endpoint=create_async_endpoint(
+                self.client.all_collections_response, EmptyRequest, self.response_class
+            ),
+        )
+
+    def register_get_collection(self):
+        """Register get collection endpoint (GET /collection/{collection_id}), served from the collections snapshot.
+        Returns:
+            None
+        """
+        self.router.add_api_route(
+            name="Get Collection",
+            path="/collections/{collection_id}",
+            response_model=Collection if self.settings.enable_response_models else None,
+            response_class=self.response_class,
+            response_model_exclude_unset=True,
+            response_model_exclude_none=True,
+            methods=["GET"],
+            endpoint=create_async_endpoint(
+                self.client.get_collection_response, CollectionUri, self.response_class
+            ),
+        )
+
+    def register_bulk_items(self):
+        """Register bulk item endpoints (GET, POST /bulk-items).
+        Returns:
+            None
+        """
+        self.router.add_api_route(
+            name="Bulk Items",
+            path="/bulk-items",
+            response_class=GeoJSONResponse,
+            methods=["POST"],
+            endpoint=create_async_endpoint(
+                self.client.bulk_items_post,
+                BulkItemsPost,
+                GeoJSONResponse,
+            ),
+        )
+        self.router.add_api_route(
+            name="Bulk Items",
+            path="/bulk-items",
+            response_class=GeoJSONResponse,
+            methods=["GET"],
+            endpoint=create_async_endpoint(
+                self.client.bulk_items_get,
+                BulkItemsGet,
+                GeoJSONResponse,
+            ),
+        )
+
+    def register_aggregations(self):
+        """Register aggregation endpoints (GET /collections/{collection_id}/datetime-histogram, POST /search/grid).
+        Returns:
+            None
+        """
+        search_request_model = self.search_post_request_model
+
+        async def search_grid(
+            request: Request,
+            search_request: search_request_model,  # type: ignore
+            zoom: int = Query(
+                0,
+                ge=0,
+                le=GRID_MAX_ZOOM,
+                description="Web map zoom level, sets the size of the grid cells.",
+            ),
+        ):
+            """Count the items matching a search per grid cell."""
+            return await self.client.search_grid(
+                search_request, zoom=zoom, request=request
+            )
+
+        self.router.add_api_route(
+            name="Search Grid",
+            path="/search/grid",
+            response_class=GeoJSONResponse,
+            methods=["POST"],
+            endpoint=search_grid,
+        )
+        self.router.add_api_route(
+            name="Datetime Histogram",
+            path="/collections/{collection_id}/datetime-histogram",
+            response_class=self.response_class,
+            methods=["GET"],
+            endpoint=create_async_endpoint(
+                self.client.datetime_histogram,
+                DatetimeHistogramGet,
+                self.response_class,
+            ),
+        )
+
+    def register_tiles(self):
+        """Register vector tile endpoints (GET /collections/{collection_id}/tiles/{z}/{x}/{y}.mvt, /searches/{search_id}/tiles/{z}/{x}/{y}.mvt).
+        Returns:
+            None
+        """
+        responses = {
+            200: {
+                "description": "Item footprints as a Mapbox Vector Tile.",
+                "content": {MVT_MEDIA_TYPE: {}},
+            }
+        }
+        self.router.add_api_route(
+            name="Collection Tile",
+            path="/collections/{collection_id}/tiles/{z}/{x}/{y}.mvt",
+            response_class=Response,
+            responses=responses,
+            methods=["GET"],
+            endpoint=create_async_endpoint(
+                self.client.collection_tile, CollectionTileGet, Response
+            ),
+        )
+        self.router.add_api_route(
+            name="Search Tile",
+            path="/searches/{search_id}/tiles/{z}/{x}/{y}.mvt",
+            response_class=Response,
+            responses=responses,
+            methods=["GET"],
+            endpoint=create_async_endpoint(
+                self.client.search_tile, SearchTileGet, Response
+            ),
+        )
+
+    def register_core(self):
+        """Register core STAC endpoints and the VEDA specific ones.
+        Returns:
+            None
+        """
+        super().register_core()
+        self.register_bulk_items()
+        self.register_aggregations()
+        self.register_tiles()
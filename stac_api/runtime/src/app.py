@@ -8,19 +8,23 @@ from src.config import extensions as PgStacExtensions
 from src.config import get_request_model as GETModel
 from src.config import post_request_model as POSTModel
 from src.extension import TiTilerExtension
+from veda_common.compression import CompressionMiddleware, CompressionPolicy
+from veda_common.limiter import ConcurrencyLimitMiddleware
 
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
-from stac_fastapi.pgstac.db import close_db_connection, connect_to_db
+from stac_fastapi.pgstac.db import close_db_connection
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 from starlette.responses import HTMLResponse, JSONResponse
 from starlette.templating import Jinja2Templates
-from starlette_cramjam.middleware import CompressionMiddleware
+from starlette.types import ASGIApp
 
 from .api import VedaStacApi
-from .core import VedaCrudClient
-from .monitoring import logger, metrics, tracer
+from .core import VedaCrudClient, collections_snapshot
+from .db import QueryCancellationMiddleware, connect_to_db, pool_status
+from .monitoring import CorrelationIdMiddleware, logger, metrics, pool_metrics
+from .slowlog import slow_queries
 
 try:
     from importlib.resources import files as resources_files  # type: ignore
@@ -28,12 +32,38 @@ except ImportError:
     # Try backported to PY<39 `importlib_resources`.
     from importlib_resources import files as resources_files  # type: ignore
 
+try:
+    # Requires the optional `geoparquet` dependencies (pyarrow, shapely)
+    from .geoparquet import GeoParquetExtension
+
+    has_geoparquet = True
+except ImportError:
+    has_geoparquet = False
+
 
 templates = Jinja2Templates(directory=str(resources_files(__package__) / "templates"))  # type: ignore
 
 api_settings = ApiSettings()
 tiles_settings = TilesApiSettings()
 
+compression_policy = CompressionPolicy(
+    minimum_size=api_settings.compression_minimum_size,
+    levels=api_settings.compression_levels,
+    streaming_size=api_settings.compression_streaming_size,
+    streaming_level=api_settings.compression_streaming_level,
+    cache_paths=api_settings.compression_cache_paths,
+    cache_size=api_settings.compression_cache_size,
+)
+
+
+class SettingsCompressionMiddleware(CompressionMiddleware):
+    """Compression with the policy of the settings, for the `middlewares` of the API."""
+
+    def __init__(self, app: ASGIApp):
+        """Wrap an ASGI application."""
+        super().__init__(app, policy=compression_policy)
+
+
 api = VedaStacApi(
     app=FastAPI(
         title=api_settings.name,
@@ -49,28 +79,37 @@ api = VedaStacApi(
     search_get_request_model=GETModel,
     search_post_request_model=POSTModel,
     response_class=ORJSONResponse,
-    middlewares=[CompressionMiddleware],
+    middlewares=[SettingsCompressionMiddleware, QueryCancellationMiddleware],
 )
 app = api.app
 
 # see https://github.com/stac-utils/stac-fastapi/issues/265
 # app.add_middleware(CompressionMiddleware)
 
-# Set all CORS enabled origins
-if api_settings.cors_origins:
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=api_settings.cors_origins,
-        allow_credentials=True,
-        allow_methods=["GET", "POST", "OPTIONS"],
-        allow_headers=["*"],
-    )
+app.add_middleware(
+    ConcurrencyLimitMiddleware,
+    routes=api_settings.concurrency_routes,
+    min_limit=api_settings.concurrency_min_limit,
+    max_limit=api_settings.concurrency_max_limit,
+    max_queue=api_settings.concurrency_max_queue,
+    queue_timeout=api_settings.concurrency_queue_timeout,
+    metrics=metrics,
+)
 
 if tiles_settings.titiler_endpoint:
     # Register to the TiTiler extension to the api
     extension = TiTilerExtension()
     extension.register(api.app, tiles_settings.titiler_endpoint)
 
+if has_geoparquet:
+    GeoParquetExtension().register(api.app)
+
+if api_settings.enable_transactions:
+    # Requires the optional `transactions` dependencies (psycopg)
+    from .ingest import BulkIngestExtension
+
+    BulkIngestExtension().register(api.app)
+
 
 @app.get("/versions", description="Get used Python library versions", tags=["Versions"])
 def versions():
@@ -93,29 +132,38 @@ async def viewer_page(request: Request):
     )
 
 
+if api_settings.debug:
+
+    @app.get("/debug/pools", include_in_schema=False)
+    async def debug_pools(request: Request):
+        """Connection pools status and timings."""
+        return {
+            "pools": {
+                "read": pool_status(request.app.state.readpool),
+                "write": pool_status(request.app.state.writepool),
+            },
+            "timings": pool_metrics.timings,
+        }
+
+    @app.get("/debug/slow-queries", include_in_schema=False)
+    async def debug_slow_queries():
+        """Most recent slow queries, with their plan when sampled."""
+        return {"slow_queries": slow_queries.recent()}
+
+
 # If the correlation header is used in the UI, we can analyze traces that originate from a given user or client
-@app.middleware("http")
-async def add_correlation_id(request: Request, call_next):
-    """Add correlation ids to all requests and subsequent logs/traces"""
-    # Get correlation id from X-Correlation-Id header
-    corr_id = request.headers.get("x-correlation-id")
-    if not corr_id:
-        try:
-            # If empty, use request id from aws context
-            corr_id = request.scope["aws.context"].aws_request_id
-        except KeyError:
-            # If empty, use uuid
-            corr_id = "local"
-    # Add correlation id to logs
-    logger.set_correlation_id(corr_id)
-    # Add correlation id to traces
-    tracer.put_annotation(key="correlation_id", value=corr_id)
-
-    response = await tracer.capture_method(call_next)(request)
-    # Return correlation header in response
-    response.headers["X-Correlation-Id"] = corr_id
-    logger.info("Request completed")
-    return response
+app.add_middleware(CorrelationIdMiddleware)
+
+# Set all CORS enabled origins, outermost for every response (shed ones included)
+# to have the CORS headers
+if api_settings.cors_origins:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=api_settings.cors_origins,
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "OPTIONS"],
+        allow_headers=["*"],
+    )
 
 
 @app.exception_handler(Exception)
@@ -129,10 +177,17 @@ async def validation_exception_handler(request, err):
 @app.on_event("startup")
 async def startup_event():
     """Connect to database on startup."""
-    await connect_to_db(app)
+    await connect_to_db(
+        app,
+        reader_hosts=api_settings.reader_hosts,
+        max_lag=api_settings.reader_max_lag,
+        check_interval=api_settings.reader_check_interval,
+    )
+    await collections_snapshot.listen(app.state.settings.reader_connection_string)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Close database connection."""
+    await collections_snapshot.close()
     await close_db_connection(app)
@@ -5,7 +5,7 @@ import base64
 import json
 import os
 from functools import lru_cache
-from typing import Optional
+from typing import Dict, List, Optional
 
 import boto3
 import pydantic
@@ -24,6 +24,9 @@ from stac_fastapi.extensions.core import (
 from stac_fastapi.pgstac.config import Settings
 from stac_fastapi.pgstac.types.search import PgstacSearch
 
+from .count import CountExtension
+from .geometry import GeometryExtension
+
 
 def get_secret_dict(secret_name: str):
     """Retrieve secrets from AWS Secrets Manager
@@ -61,12 +64,86 @@ class _ApiSettings(pydantic.BaseSettings):
     debug: bool = False
     root_path: Optional[str] = None
     pgstac_secret_arn: Optional[str]
+    export_batch_size: int = 1000
+    # Items buffered by the stac-geoparquet export before writing the file, the
+    # exported columns are those of these items
+    export_schema_window: int = 10000
+    # Bulk ingest endpoint, the API has no authentication so this must stay
+    # disabled on public deployments
+    enable_transactions: bool = False
+    ingest_batch_size: int = 500
+    # Seconds the aggregation endpoints keep their results in memory
+    aggregation_cache_ttl: int = 60
+    # Seconds the collections snapshot is kept when no change notification is
+    # received, 0 reads the collections from the database on every request
+    collections_snapshot_ttl: int = 300
+    # Comma separated read replica hosts, each with its own connection pool, the
+    # read only queries, and the pages of the searches registered on the writer, are
+    # balanced across them
+    reader_hosts: str = ""
+    # Seconds between read replica health checks
+    reader_check_interval: float = 10
+    # Read replicas lagging more than this many seconds behind the writer are ejected
+    reader_max_lag: float = 30
+    # Queries slower than this many milliseconds are logged, 0 disables the log
+    slow_query_ms: float = 1000
+    # Fraction of the slow queries which are explained on a separate connection
+    slow_query_explain_rate: float = 0.05
+    # Number of slow queries kept in memory for the debug endpoint
+    slow_query_log_size: int = 100
+    # statement_timeout, in milliseconds, of the queries of the endpoints under a
+    # path (the longest matching path wins), as a JSON object
+    statement_timeouts: Dict[str, int] = {
+        "/search": 25000,
+        "/collection-id-search": 25000,
+    }
+    # Route classes with an adaptive concurrency limit, by path regular expression
+    concurrency_routes: Dict[str, str] = {
+        "search": r"^/(search|collection-id-search)",
+        "tiles": r"/tiles/",
+    }
+    # Bounds of the concurrency limit of each route class, the maximum is the
+    # initial limit and should not exceed the connection pool size
+    concurrency_min_limit: int = 1
+    concurrency_max_limit: int = 10
+    # Requests over the limit wait in a queue of this size, at most this many seconds
+    concurrency_max_queue: int = 20
+    concurrency_queue_timeout: float = 10
+    # Responses smaller than this many bytes are not compressed
+    compression_minimum_size: int = 1024
+    # Compression level by media type, `type/*` or `*` (brotli levels, capped at 9
+    # for gzip and deflate), 0 disables the compression
+    compression_levels: Dict[str, int] = {
+        "*": 4,
+        "image/*": 0,
+        "application/vnd.apache.parquet": 0,
+    }
+    # Streamed responses, and responses of at least this many bytes (large search
+    # pages), are compressed at the streaming level as they are sent
+    compression_streaming_size: int = 1048576
+    compression_streaming_level: int = 1
+    # Responses of these paths (regular expressions) are compressed once, at the
+    # highest level, and the compressed bodies kept in a LRU cache of this size
+    compression_cache_paths: List[str] = [
+        r"^/$",
+        r"^/conformance$",
+        r"^/queryables$",
+        r"^/collections/?$",
+        r"^/collections/[^/]+/?$",
+        r"^/collections/[^/]+/queryables$",
+    ]
+    compression_cache_size: int = 256
 
     @pydantic.validator("cors_origins")
     def parse_cors_origin(cls, v):
         """Parse CORS origins."""
         return [origin.strip() for origin in v.split(",")]
 
+    @pydantic.validator("reader_hosts")
+    def parse_reader_hosts(cls, v):
+        """Parse read replica hosts."""
+        return [host.strip() for host in v.split(",") if host.strip()]
+
     def load_postgres_settings(self) -> "Settings":
         """Load postgres connection params from AWS secret"""
 
@@ -132,6 +209,8 @@ extensions = [
     FieldsExtension(),
     TokenPaginationExtension(),
     ContextExtension(),
+    GeometryExtension(),
+    CountExtension(),
 ]
 post_request_model = create_post_request_model(extensions, base_model=PgstacSearch)
 get_request_model = create_get_request_model(extensions)
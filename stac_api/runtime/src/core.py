@@ -1,7 +1,9 @@
 """CoreCrudClient extensions for the VEDA STAC API."""
 
+import hashlib
 from datetime import datetime
-from typing import Any, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+from urllib.parse import urljoin
 
 import orjson
 from asyncpg.exceptions import InvalidDatetimeFormatError
@@ -9,20 +11,584 @@ from buildpg import render
 from pydantic import ValidationError
 from pygeofilter.backends.cql2_json import to_cql2
 from pygeofilter.parsers.cql2_text import parse as parse_cql2_text
+from pypgstac.hydration import hydrate
+from stac_pydantic.links import Relations
+from stac_pydantic.shared import MimeTypes
 
 from fastapi import HTTPException
+from stac_fastapi.pgstac.config import Settings
 from stac_fastapi.pgstac.core import CoreCrudClient
-from stac_fastapi.types.errors import InvalidQueryParameter
+from stac_fastapi.pgstac.models.links import (
+    BaseLinks,
+    CollectionLinks,
+    ItemCollectionLinks,
+    ItemLinks,
+    PagingLinks,
+)
+from stac_fastapi.pgstac.types.search import PgstacSearch
+from stac_fastapi.pgstac.utils import filter_fields
+from stac_fastapi.types.errors import InvalidQueryParameter, NotFoundError
+from stac_fastapi.types.requests import get_base_url
+from stac_fastapi.types.rfc3339 import rfc3339_str_to_datetime, str_to_interval
+from stac_fastapi.types.stac import Collection, Collections, Item, ItemCollection
 from starlette.requests import Request
+from starlette.responses import Response
 
-from .search import CollectionSearchPost
+from . import pgsearch
+from .cache import TTLCache
+from .config import ApiSettings
+from .count import COUNT_SETTINGS, CountStrategy
+from .search import BulkItemsPost, CollectionSearchPost, HistogramInterval
+from .snapshot import CollectionsSnapshot
 
 NumType = Union[float, int]
 
+GEOJSON_MEDIA_TYPE = "application/geo+json"
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+# Footprint grids have GRID_CELLS_PER_TILE cells across a web map tile of the
+# requested zoom, at most (360 / cell size) * (180 / cell size) cells.
+GRID_CELLS_PER_TILE = 8
+GRID_MAX_ZOOM = 6
+
+# Vector tiles
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+TILE_MAX_FEATURES = 10000
+
+api_settings = ApiSettings()
+
+aggregation_cache = TTLCache(ttl=api_settings.aggregation_cache_ttl)
+collections_snapshot = CollectionsSnapshot(ttl=api_settings.collections_snapshot_ttl)
+
+
+def content_etag(content: bytes) -> str:
+    """Return a strong ETag for a response body."""
+    return f'"{hashlib.sha1(content).hexdigest()}"'
+
+
+def if_none_match(request: Request, etag: str) -> bool:
+    """Check if the client already has the representation with this ETag.
+
+    Only GET and HEAD requests are answered with a 304.
+    """
+    if request.method not in ["GET", "HEAD"]:
+        return False
+
+    values = [v.strip() for v in request.headers.get("if-none-match", "").split(",")]
+    return "*" in values or etag in values or f"W/{etag}" in values
+
+
+def conditional_response(
+    request: Request,
+    content: bytes,
+    etag: str,
+    media_type: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Return the content with its ETag, or a 304 if the client already has it."""
+    headers = {"ETag": etag, **(headers or {})}
+    if if_none_match(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+def parse_bbox(bbox: Optional[List[NumType]]) -> Optional[List[float]]:
+    """Parse a 2D or 3D bbox query parameter into [xmin, ymin, xmax, ymax]."""
+    if not bbox:
+        return None
+
+    try:
+        values = [float(v) for v in bbox]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid bbox {bbox}")
+
+    if len(values) == 6:
+        values = [values[0], values[1], values[3], values[4]]
+    if len(values) != 4 or values[0] > values[2] or values[1] > values[3]:
+        raise HTTPException(status_code=400, detail=f"Invalid bbox {bbox}")
+
+    return values
+
+
+def grid_cell_size(zoom: int) -> float:
+    """Return the footprint grid cell size, in degrees, for a zoom level."""
+    return 360.0 / (GRID_CELLS_PER_TILE * 2**zoom)
+
+
+def parse_datetime_interval(
+    interval: Optional[str],
+) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Parse a datetime query parameter (single datetime or interval) into start and end."""
+    if not interval:
+        return None, None
+
+    try:
+        if "/" not in interval:
+            value = rfc3339_str_to_datetime(interval)
+            return value, value
+
+        return str_to_interval(interval)  # type: ignore
+    except ValueError as e:
+        raise InvalidQueryParameter(f"Datetime parameter {interval} is invalid. {e}")
+
 
 class VedaCrudClient(CoreCrudClient):
     """Veda STAC API Client."""
 
+    async def all_collections(self, request: Request, **kwargs) -> Collections:
+        """Read all collections from the in-process snapshot.
+        Called with `GET /collections` and by the landing page.
+        Returns:
+            Collections.
+        """
+        if not collections_snapshot.enabled:
+            return await super().all_collections(request, **kwargs)
+
+        snapshot = await collections_snapshot.get(request)
+        linked_collections: List[Collection] = []
+        for c in snapshot.values():
+            coll = Collection(**c)
+            coll["links"] = await CollectionLinks(
+                collection_id=coll["id"], request=request
+            ).get_links(extra_links=coll.get("links"))
+            linked_collections.append(coll)
+
+        base_url = get_base_url(request)
+        links = [
+            {
+                "rel": Relations.root.value,
+                "type": MimeTypes.json,
+                "href": base_url,
+            },
+            {
+                "rel": Relations.parent.value,
+                "type": MimeTypes.json,
+                "href": base_url,
+            },
+            {
+                "rel": Relations.self.value,
+                "type": MimeTypes.json,
+                "href": urljoin(base_url, "collections"),
+            },
+        ]
+        return Collections(collections=linked_collections, links=links)
+
+    async def get_collection(
+        self, collection_id: str, request: Request, **kwargs
+    ) -> Collection:
+        """Get collection by id from the in-process snapshot.
+        Called with `GET /collections/{collection_id}` and to check that a collection exists.
+        Returns:
+            Collection.
+        """
+        if collections_snapshot.enabled:
+            snapshot = await collections_snapshot.get(request)
+            if collection_id in snapshot:
+                collection = Collection(**snapshot[collection_id])
+                collection["links"] = await CollectionLinks(
+                    collection_id=collection_id, request=request
+                ).get_links(extra_links=collection.get("links"))
+                return collection
+
+        # Not in the snapshot (yet), ask the database
+        return await super().get_collection(collection_id, request, **kwargs)
+
+    async def _check_collection(self, collection_id: str, request: Request) -> None:
+        """Raise NotFoundError if a collection does not exist.
+
+        Cheaper than `get_collection` (no links) and cached, for the endpoints
+        called many times per collection such as the tiles.
+        """
+        if collections_snapshot.enabled:
+            if collection_id in await collections_snapshot.get(request):
+                return
+
+        key = ("collection-exists", collection_id)
+        if aggregation_cache.get(key) is None:
+            # If collection does not exist, NotFoundError wil be raised
+            await super().get_collection(collection_id, request)
+            aggregation_cache.set(key, True)
+
+    async def all_collections_response(self, request: Request, **kwargs) -> Response:
+        """All collections, serialized once per snapshot and base URL.
+        Called with `GET /collections`.
+        Returns:
+            JSON response with an ETag, or 304 if the client has it already.
+        """
+        if not collections_snapshot.enabled:
+            return await self.all_collections(request, **kwargs)
+
+        content, etag = await collections_snapshot.rendered(
+            request,
+            ("collections", get_base_url(request)),
+            lambda: self.all_collections(request),
+        )
+        return conditional_response(request, content, etag, MimeTypes.json.value)
+
+    async def get_collection_response(
+        self, collection_id: str, request: Request, **kwargs
+    ) -> Response:
+        """A collection, serialized once per snapshot and base URL.
+        Called with `GET /collections/{collection_id}`.
+        Returns:
+            JSON response with an ETag, or 304 if the client has it already.
+        """
+        if not collections_snapshot.enabled:
+            return await self.get_collection(collection_id, request, **kwargs)
+
+        content, etag = await collections_snapshot.rendered(
+            request,
+            ("collection", collection_id, get_base_url(request)),
+            lambda: self.get_collection(collection_id, request),
+        )
+        return conditional_response(request, content, etag, MimeTypes.json.value)
+
+    def _use_passthrough(self, search_request: PgstacSearch, request: Request) -> bool:
+        """Check if a search can be served from the raw pgstac JSON.
+
+        Hydration and response models need the items as python dicts, so either of
+        them sends the request down the regular path. The fields extension is
+        applied by pgstac itself.
+        """
+        settings: Settings = request.app.state.settings
+        if settings.use_api_hydrate or settings.enable_response_models:
+            return False
+
+        return True
+
+    def _search_option(
+        self, search_request: PgstacSearch, request: Request, name: str
+    ) -> Any:
+        """Return a VEDA search option (geometry simplification, count strategy).
+
+        `GET /search` does not forward them to the search model, they are read from
+        the request state set by `get_search`.
+        """
+        value = getattr(search_request, name, None)
+        if value is None:
+            value = getattr(request.state, name, None)
+        return value
+
+    def _count_settings(self, search_request: Any, request: Request) -> Dict[str, str]:
+        """Return the pgstac context settings of the requested count strategy.
+
+        pgstac only reads the context settings from the search `conf` to decide
+        whether to return `numberMatched`, the count itself is driven by the
+        `pgstac.context*` settings, so both are set.
+        """
+        count = self._search_option(search_request, request, "count")
+        if count is None:
+            return {}
+
+        settings = COUNT_SETTINGS[count]
+        search_request.conf = search_request.conf or {}
+        search_request.conf.update(settings)
+        return settings
+
+    async def _search_passthrough(
+        self,
+        search_request: PgstacSearch,
+        request: Request,
+        links_class: Optional[Type[BaseLinks]] = None,
+        **links_kwargs: Any,
+    ) -> Response:
+        """Cross catalog search returning pgstac's JSON text without re-encoding it.
+
+        Only the small envelope (context, paging links) and the links of each item are
+        built in python, the item bodies are spliced into the response as they come
+        from the database.
+        Args:
+            search_request: search request parameters.
+            links_class: optional links class wrapping the paging links (e.g `ItemCollectionLinks`).
+        Returns:
+            GeoJSON response with the ItemCollection matching the search criteria.
+        """
+        count_settings = self._count_settings(search_request, request)
+        search_request.conf = search_request.conf or {}
+        search_request.conf["nohydrate"] = False
+        req = search_request.json(
+            exclude_none=True,
+            by_alias=True,
+            exclude={"simplify", "precision", "count"},
+        )
+
+        # Geometries are simplified and/or snapped to a grid by the database, only
+        # when asked for, so that the default query stays a plain JSON passthrough
+        body = "feature.f - 'links'"
+        params: Dict[str, Any] = {}
+        simplify = self._search_option(search_request, request, "simplify")
+        precision = self._search_option(search_request, request, "precision")
+        if simplify is not None or precision is not None:
+            geometry = "ST_GeomFromGeoJSON(feature.f->'geometry')"
+            if simplify is not None:
+                geometry = f"ST_SimplifyPreserveTopology({geometry}, :simplify)"
+                params["simplify"] = simplify
+            if precision is not None:
+                geometry = f"ST_ReducePrecision({geometry}, :grid)"
+                params["grid"] = 10.0**-precision
+            params["digits"] = precision if precision is not None else 9
+            body = f"""
+                CASE WHEN jsonb_typeof(feature.f->'geometry') = 'object'
+                    THEN jsonb_set(
+                        {body}, '{{geometry}}', ST_AsGeoJSON({geometry}, :digits)::jsonb
+                    )
+                    ELSE {body}
+                END
+            """
+
+        fields = getattr(search_request, "fields", None)
+        exclude_links = bool(fields and fields.exclude and "links" in fields.exclude)
+
+        try:
+            meta, rows = await pgsearch.search(
+                request,
+                req,
+                count_settings,
+                columns=f"feature.f->'links' AS links, ({body})::text AS body",
+                **params,
+            )
+        except InvalidDatetimeFormatError:
+            raise InvalidQueryParameter(
+                f"Datetime parameter {search_request.datetime} is invalid."
+            )
+
+        next: Optional[str] = meta.pop("next", None)
+        prev: Optional[str] = meta.pop("prev", None)
+
+        links = await PagingLinks(request=request, next=next, prev=prev).get_links()
+        if links_class is not None:
+            links = await links_class(request=request, **links_kwargs).get_links(
+                extra_links=links
+            )
+        meta["links"] = links
+
+        features: List[bytes] = []
+        for row in rows:
+            if exclude_links:
+                features.append(row["body"].encode())
+            else:
+                features.append(await self._item_body(row, request))
+
+        content = (
+            orjson.dumps(meta)[:-1] + b',"features":[' + b",".join(features) + b"]}"
+        )
+        return conditional_response(
+            request, content, content_etag(content), GEOJSON_MEDIA_TYPE
+        )
+
+    async def _item_body(self, row: Any, request: Request) -> bytes:
+        """Splice the item links into the JSON text of an item (without its links)."""
+        body = row["body"].encode()
+        if not row["collection"] or not row["id"]:
+            return body
+
+        item_links = await ItemLinks(
+            collection_id=row["collection"],
+            item_id=row["id"],
+            request=request,
+        ).get_links(extra_links=row["links"])
+        body = b'{"links":' + orjson.dumps(item_links) + b"," + body[1:]
+        # An empty body (`{}`) leaves a trailing comma behind
+        if body.endswith(b",}"):
+            body = body[:-2] + b"}"
+
+        return body
+
+    async def get_item(
+        self, item_id: str, collection_id: str, request: Request, **kwargs
+    ) -> Any:
+        """Get item by id, from the raw pgstac JSON.
+        Called with `GET /collections/{collection_id}/items/{item_id}`.
+        Returns:
+            GeoJSON response with the item and its ETag, or 304 if the client has it already.
+        """
+        settings: Settings = request.app.state.settings
+        if settings.use_api_hydrate or settings.enable_response_models:
+            return await super().get_item(item_id, collection_id, request, **kwargs)
+
+        # If collection does not exist, NotFoundError wil be raised
+        await self.get_collection(collection_id, request)
+
+        async with request.app.state.get_connection(request, "r") as conn:
+            q, p = render(
+                """
+                SELECT
+                    item->>'id' AS id,
+                    item->>'collection' AS collection,
+                    item->'links' AS links,
+                    (item - 'links')::text AS body
+                FROM get_item(:item_id::text, :collection_id::text) AS item;
+                """,
+                item_id=item_id,
+                collection_id=collection_id,
+            )
+            row = await conn.fetchrow(q, *p)
+
+        if row is None or row["body"] is None:
+            raise NotFoundError(
+                f"Item {item_id} in Collection {collection_id} does not exist."
+            )
+
+        content = await self._item_body(row, request)
+        return conditional_response(
+            request, content, content_etag(content), GEOJSON_MEDIA_TYPE
+        )
+
+    async def _search_base(
+        self, search_request: PgstacSearch, request: Request
+    ) -> ItemCollection:
+        """Cross catalog search returning the items as python dicts.
+
+        Same as the stac-fastapi search, for the hydration in the API and the
+        response models, but with the pgstac context settings of the requested
+        count strategy.
+        Args:
+            search_request: search request parameters.
+        Returns:
+            ItemCollection containing items which match the search criteria.
+        """
+        settings: Settings = request.app.state.settings
+        count_settings = self._count_settings(search_request, request)
+        search_request.conf = search_request.conf or {}
+        search_request.conf["nohydrate"] = settings.use_api_hydrate
+        req = search_request.json(exclude_none=True, by_alias=True, exclude={"count"})
+
+        try:
+            meta, rows = await pgsearch.search(
+                request, req, count_settings, columns="feature.f AS feature"
+            )
+        except InvalidDatetimeFormatError:
+            raise InvalidQueryParameter(
+                f"Datetime parameter {search_request.datetime} is invalid."
+            )
+
+        items = {**meta, "features": [row["feature"] for row in rows]}
+        next: Optional[str] = items.pop("next", None)
+        prev: Optional[str] = items.pop("prev", None)
+        collection = ItemCollection(**items)
+
+        fields = getattr(search_request, "fields", None)
+        include = (fields and fields.include) or None
+        exclude = (fields and fields.exclude) or None
+        base_item_cache = settings.base_item_cache(
+            fetch_base_item=lambda collection_id: self._get_base_item(
+                collection_id, request
+            ),
+            request=request,
+        )
+
+        features: List[Item] = []
+        for feature in collection.get("features") or []:
+            # The ids of the links, which the fields extension may remove
+            collection_id = feature.get("collection")
+            item_id = feature.get("id")
+            if settings.use_api_hydrate:
+                base_item = await base_item_cache.get(collection_id)
+                feature = filter_fields(hydrate(base_item, feature), include, exclude)
+
+            if (
+                (exclude is None or "links" not in exclude)
+                and collection_id
+                and item_id
+            ):
+                feature["links"] = await ItemLinks(
+                    collection_id=collection_id,
+                    item_id=item_id,
+                    request=request,
+                ).get_links(extra_links=feature.get("links"))
+            features.append(feature)
+
+        collection["features"] = features
+        collection["links"] = await PagingLinks(
+            request=request, next=next, prev=prev
+        ).get_links()
+        return collection
+
+    async def get_search(
+        self,
+        request: Request,
+        simplify: Optional[float] = None,
+        precision: Optional[int] = None,
+        count: Optional[CountStrategy] = None,
+        **kwargs,
+    ) -> Any:
+        """Cross catalog search (GET).
+        Called with `GET /search`.
+        Returns:
+            ItemCollection containing items which match the search criteria.
+        """
+        request.state.simplify = simplify
+        request.state.precision = precision
+        request.state.count = count
+        return await super().get_search(request, **kwargs)
+
+    async def post_search(
+        self, search_request: PgstacSearch, request: Request, **kwargs
+    ) -> Any:
+        """Cross catalog search (POST).
+        Called with `POST /search` (and `GET /search` once its parameters are parsed).
+        Args:
+            search_request: search request parameters.
+        Returns:
+            ItemCollection containing items which match the search criteria.
+        """
+        if self._use_passthrough(search_request, request):
+            return await self._search_passthrough(search_request, request)
+
+        return await super().post_search(search_request, request, **kwargs)
+
+    async def item_collection(
+        self,
+        collection_id: str,
+        request: Request,
+        bbox: Optional[List[NumType]] = None,
+        datetime: Optional[Union[str, datetime]] = None,
+        limit: Optional[int] = None,
+        token: Optional[str] = None,
+        **kwargs,
+    ) -> Any:
+        """Get all items from a specific collection.
+        Called with `GET /collections/{collection_id}/items`.
+        Returns:
+            An ItemCollection.
+        """
+        base_args = {
+            "collections": [collection_id],
+            "bbox": bbox,
+            "datetime": datetime,
+            "limit": limit,
+            "token": token,
+        }
+
+        clean = {}
+        for k, v in base_args.items():
+            if v is not None and v != []:
+                clean[k] = v
+
+        search_request = self.post_request_model(**clean)
+        if not self._use_passthrough(search_request, request):
+            return await super().item_collection(
+                collection_id,
+                request,
+                bbox=bbox,
+                datetime=datetime,
+                limit=limit,
+                token=token,
+                **kwargs,
+            )
+
+        # If collection does not exist, NotFoundError wil be raised
+        await self.get_collection(collection_id, request)
+
+        return await self._search_passthrough(
+            search_request,
+            request,
+            links_class=ItemCollectionLinks,
+            collection_id=collection_id,
+        )
+
     async def _collection_id_search_base(
         self,
         search_request: CollectionSearchPost,
@@ -36,25 +602,29 @@ class VedaCrudClient(CoreCrudClient):
             ItemCollection containing items which match the search criteria.
         """
         request: Request = kwargs["request"]
-        pool = request.app.state.readpool
 
+        count_settings = self._count_settings(search_request, request)
         search_request.conf = search_request.conf or {}
-        req = search_request.json(exclude_none=True, by_alias=True)
+        req = search_request.json(exclude_none=True, by_alias=True, exclude={"count"})
 
         try:
-            async with pool.acquire() as conn:
-                q, p = render(
-                    """
-                    SELECT * FROM collection_id_search(:req::text::jsonb);
-                    """,
-                    req=req,
-                )
-                collections = await conn.fetch(q, *p)
+            registration = await pgsearch.register(request, req, count_settings)
         except InvalidDatetimeFormatError:
             raise InvalidQueryParameter(
                 f"Datetime parameter {search_request.datetime} is invalid."
             )
 
+        # The collections of the items of the search, as `collection_id_search`
+        # (which creates a temporary table, refused by the read replicas)
+        async with request.app.state.get_connection(request, "r") as conn:
+            collections = await conn.fetch(
+                f"""
+                SELECT DISTINCT collection AS collection_id_search
+                FROM items
+                WHERE ({registration.where}) AND content IS NOT NULL;
+                """
+            )
+
         return [collection["collection_id_search"] for collection in collections]
 
     async def collection_id_post_search(
@@ -75,6 +645,7 @@ class VedaCrudClient(CoreCrudClient):
         bbox: Optional[List[NumType]] = None,
         datetime: Optional[Union[str, datetime]] = None,
         filter: Optional[str] = None,
+        count: Optional[CountStrategy] = None,
         **kwargs,
     ) -> List[str]:
         """Cross catalog search (GET).
@@ -83,7 +654,7 @@ class VedaCrudClient(CoreCrudClient):
             A list of collection IDs which match the search criteria.
         """
         # Parse request parameters
-        base_args = {"bbox": bbox}
+        base_args = {"bbox": bbox, "count": count}
 
         if filter:
             ast = parse_cql2_text(filter)
@@ -109,3 +680,407 @@ class VedaCrudClient(CoreCrudClient):
         return await self.collection_id_post_search(
             search_request, request=kwargs["request"]
         )
+
+    async def bulk_items_post(
+        self, bulk_request: BulkItemsPost, **kwargs
+    ) -> Dict[str, Any]:
+        """Fetch a list of items in a single database round trip.
+        Called with `POST /bulk-items`.
+        Args:
+            bulk_request: list of collection and item ID pairs.
+        Returns:
+            FeatureCollection with the items found, in the order they were requested,
+            and the list of the pairs that do not exist.
+        """
+        request: Request = kwargs["request"]
+
+        async with request.app.state.get_connection(request, "r") as conn:
+            q, p = render(
+                """
+                SELECT req.collection, req.id, get_item(req.id, req.collection) AS item
+                FROM unnest(:collections::text[], :ids::text[])
+                    WITH ORDINALITY AS req(collection, id, n)
+                ORDER BY req.n;
+                """,
+                collections=[ref.collection for ref in bulk_request.items],
+                ids=[ref.id for ref in bulk_request.items],
+            )
+            rows = await conn.fetch(q, *p)
+
+        features: List[Item] = []
+        missing: List[Dict[str, str]] = []
+        for row in rows:
+            item = row["item"]
+            if item is None:
+                missing.append({"collection": row["collection"], "id": row["id"]})
+                continue
+
+            item["links"] = await ItemLinks(
+                collection_id=row["collection"],
+                item_id=row["id"],
+                request=request,
+            ).get_links(extra_links=item.get("links"))
+            features.append(Item(**item))
+
+        base_url = get_base_url(request)
+        return {
+            "type": "FeatureCollection",
+            "features": features,
+            "missing": missing,
+            "numberReturned": len(features),
+            "links": [
+                {
+                    "rel": Relations.root.value,
+                    "type": MimeTypes.json,
+                    "href": base_url,
+                },
+                {
+                    "rel": Relations.self.value,
+                    "type": MimeTypes.geojson,
+                    "href": str(request.url),
+                },
+            ],
+        }
+
+    async def bulk_items_get(
+        self,
+        ids: Optional[List[str]] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Fetch a list of items in a single database round trip.
+        Called with `GET /bulk-items?ids={collection_id}/{item_id},...`.
+        Returns:
+            FeatureCollection with the items found, in the order they were requested,
+            and the list of the pairs that do not exist.
+        """
+        items = []
+        for ref in ids or []:
+            collection_id, sep, item_id = ref.partition("/")
+            if not sep or not collection_id or not item_id:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid item reference {ref}, must be {{collection_id}}/{{item_id}}",
+                )
+            items.append({"collection": collection_id, "id": item_id})
+
+        try:
+            bulk_request = BulkItemsPost(items=items)
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=400, detail=f"Invalid parameters provided {e}"
+            )
+        return await self.bulk_items_post(bulk_request, request=kwargs["request"])
+
+    async def datetime_histogram(
+        self,
+        collection_id: str,
+        interval: HistogramInterval = HistogramInterval.day,
+        bbox: Optional[List[NumType]] = None,
+        datetime: Optional[str] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Count the items of a collection per day, month or year.
+        Called with `GET /collections/{collection_id}/datetime-histogram`.
+        Returns:
+            The item counts of the non empty buckets, in chronological order.
+        """
+        request: Request = kwargs["request"]
+        envelope = parse_bbox(bbox)
+        start, end = parse_datetime_interval(datetime)
+
+        key = ("datetime-histogram", collection_id, interval, str(envelope), datetime)
+        buckets = aggregation_cache.get(key)
+        if buckets is None:
+            # Filter on the partition keys (collection, datetime) with plain
+            # comparisons only, so that the planner prunes the partitions
+            where = ["collection = :collection_id"]
+            params: Dict[str, Any] = {
+                "collection_id": collection_id,
+                "interval": interval.value,
+            }
+            if start is not None:
+                where.append("datetime >= :start::timestamptz")
+                params["start"] = start
+            if end is not None:
+                where.append("datetime <= :end::timestamptz")
+                params["end"] = end
+            if envelope is not None:
+                where.append(
+                    "ST_Intersects(geometry, ST_MakeEnvelope(:xmin, :ymin, :xmax, :ymax, 4326))"
+                )
+                params.update(zip(["xmin", "ymin", "xmax", "ymax"], envelope))
+
+            async with request.app.state.get_connection(request, "r") as conn:
+                q, p = render(
+                    f"""
+                    SELECT
+                        date_trunc(:interval, datetime AT TIME ZONE 'UTC') AS bucket,
+                        count(*) AS count
+                    FROM items
+                    WHERE {" AND ".join(where)}
+                    GROUP BY 1
+                    ORDER BY 1;
+                    """,
+                    **params,
+                )
+                rows = await conn.fetch(q, *p)
+
+            if not rows:
+                # If collection does not exist, NotFoundError wil be raised
+                await self.get_collection(collection_id, request)
+
+            buckets = [
+                {
+                    "datetime": row["bucket"].strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "count": row["count"],
+                }
+                for row in rows
+            ]
+            aggregation_cache.set(key, buckets)
+
+        return {
+            "collection": collection_id,
+            "interval": interval.value,
+            "buckets": buckets,
+            "numberMatched": sum(bucket["count"] for bucket in buckets),
+            "links": [
+                {
+                    "rel": Relations.self.value,
+                    "type": MimeTypes.json,
+                    "href": str(request.url),
+                },
+            ],
+        }
+
+    async def search_grid(
+        self, search_request: PgstacSearch, zoom: int, **kwargs
+    ) -> Dict[str, Any]:
+        """Count the items of a search per cell of a regular lon/lat grid.
+        Called with `POST /search/grid`.
+        Args:
+            search_request: search request parameters, `limit` and paging are ignored.
+            zoom: web map zoom level setting the size of the cells.
+        Returns:
+            GeoJSON FeatureCollection with one polygon per non empty cell and its item count.
+        """
+        request: Request = kwargs["request"]
+        size = grid_cell_size(zoom)
+
+        search_request.conf = search_request.conf or {}
+        req = search_request.json(
+            exclude_none=True,
+            by_alias=True,
+            exclude={"limit", "token", "sortby", "fields"},
+        )
+        envelope = parse_bbox(search_request.bbox)
+
+        key = ("search-grid", req, zoom)
+        cells = aggregation_cache.get(key)
+        if cells is None:
+            try:
+                async with request.app.state.get_connection(request, "r") as conn:
+                    q, p = render(
+                        "SELECT stac_search_to_where(:req::text::jsonb);", req=req
+                    )
+                    where = await conn.fetchval(q, *p)
+
+                    # The geometries are clipped to the searched bbox before they are
+                    # gridded, so that the number of cells (and the size of the
+                    # response) is bound by the map viewport, not by the items extent.
+                    geometry = "items.geometry"
+                    params: Dict[str, Any] = {"size": size}
+                    if envelope is not None:
+                        geometry = "ST_ClipByBox2D(items.geometry, ST_MakeEnvelope(:xmin, :ymin, :xmax, :ymax, 4326))"
+                        params.update(zip(["xmin", "ymin", "xmax", "ymax"], envelope))
+
+                    q, p = render(
+                        f"""
+                        SELECT g.i, g.j, count(*) AS count
+                        FROM items,
+                        LATERAL (SELECT {geometry} AS geom) AS clipped,
+                        ST_SquareGrid(:size, clipped.geom) AS g
+                        WHERE ({where})
+                        AND NOT ST_IsEmpty(clipped.geom)
+                        AND ST_Intersects(g.geom, clipped.geom)
+                        GROUP BY g.i, g.j
+                        ORDER BY g.j, g.i;
+                        """,
+                        **params,
+                    )
+                    rows = await conn.fetch(q, *p)
+            except InvalidDatetimeFormatError:
+                raise InvalidQueryParameter(
+                    f"Datetime parameter {search_request.datetime} is invalid."
+                )
+
+            cells = [(row["i"], row["j"], row["count"]) for row in rows]
+            aggregation_cache.set(key, cells)
+
+        features = []
+        for i, j, count in cells:
+            xmin, ymin = round(i * size, 6), round(j * size, 6)
+            xmax, ymax = round(xmin + size, 6), round(ymin + size, 6)
+            features.append(
+                {
+                    "type": "Feature",
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [
+                            [
+                                [xmin, ymin],
+                                [xmax, ymin],
+                                [xmax, ymax],
+                                [xmin, ymax],
+                                [xmin, ymin],
+                            ]
+                        ],
+                    },
+                    "properties": {"count": count},
+                }
+            )
+
+        return {
+            "type": "FeatureCollection",
+            "zoom": zoom,
+            "cellSize": size,
+            "features": features,
+            "numberReturned": len(features),
+        }
+
+    async def _tile(
+        self,
+        request: Request,
+        where: str,
+        z: int,
+        x: int,
+        y: int,
+        properties: Optional[List[str]] = None,
+    ) -> Response:
+        """Render the items matching a pgstac WHERE clause as a Mapbox Vector Tile.
+
+        Footprints are simplified to about a pixel of the zoom level and clipped to
+        the (buffered) tile before being projected, the response carries an ETag
+        of its content.
+        """
+        if x >= 2**z or y >= 2**z:
+            raise InvalidQueryParameter(f"Tile {z}/{x}/{y} is out of bounds.")
+
+        async with request.app.state.get_connection(request, "r") as conn:
+            q, p = render(
+                f"""
+                WITH bounds AS (
+                    SELECT
+                        ST_TileEnvelope(:z, :x, :y) AS geom,
+                        ST_Transform(
+                            ST_TileEnvelope(:z, :x, :y, margin => :margin), 4326
+                        ) AS clip
+                ),
+                features AS (
+                    SELECT
+                        ST_AsMVTGeom(
+                            ST_Transform(
+                                ST_ClipByBox2D(
+                                    ST_Simplify(items.geometry, :tolerance, true),
+                                    bounds.clip
+                                ),
+                                3857
+                            ),
+                            bounds.geom,
+                            :extent,
+                            :buffer,
+                            true
+                        ) AS geom,
+                        items.id,
+                        items.collection,
+                        to_char(
+                            items.datetime AT TIME ZONE 'UTC',
+                            'YYYY-MM-DD"T"HH24:MI:SS"Z"'
+                        ) AS datetime,
+                        (
+                            SELECT jsonb_strip_nulls(
+                                jsonb_object_agg(k, items.content->'properties'->k)
+                            )
+                            FROM unnest(:properties::text[]) AS k
+                        ) AS properties
+                    FROM items, bounds
+                    WHERE ({where})
+                    AND ST_Intersects(items.geometry, bounds.clip)
+                    LIMIT :limit
+                )
+                SELECT ST_AsMVT(features, 'items', :extent, 'geom')
+                FROM features
+                WHERE geom IS NOT NULL;
+                """,
+                z=z,
+                x=x,
+                y=y,
+                margin=TILE_BUFFER / TILE_EXTENT,
+                tolerance=360.0 / (256 * 2**z),
+                extent=TILE_EXTENT,
+                buffer=TILE_BUFFER,
+                properties=properties or [],
+                limit=TILE_MAX_FEATURES,
+            )
+            content = await conn.fetchval(q, *p) or b""
+
+        return conditional_response(
+            request,
+            content,
+            content_etag(content),
+            MVT_MEDIA_TYPE,
+            headers={"Cache-Control": api_settings.cachecontrol},
+        )
+
+    async def collection_tile(
+        self,
+        collection_id: str,
+        z: int,
+        x: int,
+        y: int,
+        properties: Optional[List[str]] = None,
+        **kwargs,
+    ) -> Response:
+        """Get the item footprints of a collection as a Mapbox Vector Tile.
+        Called with `GET /collections/{collection_id}/tiles/{z}/{x}/{y}.mvt`.
+        Returns:
+            Vector tile with a single `items` layer.
+        """
+        request: Request = kwargs["request"]
+        await self._check_collection(collection_id, request)
+        async with request.app.state.get_connection(request, "r") as conn:
+            q, p = render(
+                "SELECT stac_search_to_where(:req::text::jsonb);",
+                req=orjson.dumps({"collections": [collection_id]}).decode(),
+            )
+            where = await conn.fetchval(q, *p)
+
+        return await self._tile(request, where, z, x, y, properties)
+
+    async def search_tile(
+        self,
+        search_id: str,
+        z: int,
+        x: int,
+        y: int,
+        properties: Optional[List[str]] = None,
+        **kwargs,
+    ) -> Response:
+        """Get the item footprints of a registered search as a Mapbox Vector Tile.
+        Called with `GET /searches/{search_id}/tiles/{z}/{x}/{y}.mvt`.
+        Args:
+            search_id: hash of a search registered in pgstac (e.g. a raster API mosaic).
+        Returns:
+            Vector tile with a single `items` layer.
+        """
+        request: Request = kwargs["request"]
+        async with request.app.state.get_connection(request, "r") as conn:
+            q, p = render(
+                "SELECT stac_search_to_where(search) FROM searches WHERE hash = :hash;",
+                hash=search_id,
+            )
+            where = await conn.fetchval(q, *p)
+
+        if where is None:
+            raise NotFoundError(f"Search {search_id} does not exist.")
+
+        return await self._tile(request, where, z, x, y, properties)
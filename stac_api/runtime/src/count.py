@@ -0,0 +1,75 @@
+"""Count strategy extension."""
+
+from enum import Enum
+from typing import Dict, List, Optional
+
+import attr
+from pydantic import BaseModel
+
+from fastapi import FastAPI, Query
+from stac_fastapi.types.extension import ApiExtension
+from stac_fastapi.types.search import APIRequest
+
+
+class CountStrategy(str, Enum):
+    """How `numberMatched` is computed."""
+
+    none = "none"
+    estimated = "estimated"
+    exact = "exact"
+
+
+# pgstac context settings of each strategy
+COUNT_SETTINGS: Dict[CountStrategy, Dict[str, str]] = {
+    CountStrategy.none: {"context": "off"},
+    # Never run count(*), report the query planner estimate
+    CountStrategy.estimated: {
+        "context": "auto",
+        "context_estimated_count": "0",
+        "context_estimated_cost": "0",
+    },
+    CountStrategy.exact: {"context": "on"},
+}
+
+
+@attr.s
+class CountExtensionGetRequest(APIRequest):
+    """Count strategy arguments for GET Request."""
+
+    count: Optional[CountStrategy] = attr.ib(
+        default=Query(
+            None,
+            description="numberMatched strategy, defaults to the database context setting.",
+        )
+    )
+
+
+class CountExtensionPostRequest(BaseModel):
+    """Count strategy arguments for POST Request."""
+
+    count: Optional[CountStrategy]
+
+
+@attr.s
+class CountExtension(ApiExtension):
+    """Count strategy extension.
+
+    Adds `count` (none, estimated or exact) to `/search` to override pgstac's
+    `context` setting for a single request.
+    """
+
+    GET = CountExtensionGetRequest
+    POST = CountExtensionPostRequest
+
+    conformance_classes: List[str] = attr.ib(factory=list)
+    schema_href: Optional[str] = attr.ib(default=None)
+
+    def register(self, app: FastAPI) -> None:
+        """Register the extension with a FastAPI application.
+        Args:
+            app: target FastAPI application.
+        Returns:
+            None
+
+        """
+        pass
@@ -0,0 +1,382 @@
+"""Database connection pools, with read queries balanced across read replicas."""
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, List, Literal, Optional, Set
+
+import asyncpg
+
+from fastapi import FastAPI, HTTPException
+from stac_fastapi.pgstac.config import Settings
+from stac_fastapi.pgstac.db import DB
+from stac_fastapi.pgstac.db import connect_to_db as pgstac_connect_to_db
+from stac_fastapi.pgstac.db import translate_pgstac_errors
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import ApiSettings
+from .monitoring import logger, pool_metrics
+from .slowlog import slow_queries
+
+# Seconds behind the writer, 0 when the replica has replayed all it received (an
+# idle writer does not move the last replay timestamp)
+REPLICATION_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(
+            extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END;
+"""
+
+api_settings = ApiSettings()
+
+# Errors which mean the replica, rather than the query, is unusable
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.InterfaceError,
+)
+
+
+class RequestQueries:
+    """Cancellation callbacks of the queries a request is running."""
+
+    def __init__(self):
+        """Initialize for a connected client."""
+        self.disconnected = False
+        self.cancels: Set[Callable[[], Any]] = set()
+
+    def disconnect(self) -> None:
+        """Cancel the running queries, the client is gone."""
+        self.disconnected = True
+        for cancel in list(self.cancels):
+            cancel()
+
+
+# Set by `QueryCancellationMiddleware` for each request
+_request_queries: ContextVar[Optional[RequestQueries]] = ContextVar(
+    "request_queries", default=None
+)
+
+
+class QueryCancellationMiddleware:
+    """Cancel the database queries of a request when its client disconnects.
+
+    The ASGI `receive` channel is read ahead by a task, which forwards the messages
+    to the application and catches the disconnection while the request is handled.
+    """
+
+    def __init__(self, app: ASGIApp):
+        """Wrap an ASGI application."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request, watching for the client disconnection."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries()
+        messages: "asyncio.Queue[Message]" = asyncio.Queue()
+
+        async def read() -> None:
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    queries.disconnect()
+                    return
+
+        async def receive_message() -> Message:
+            if queries.disconnected and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        reader = asyncio.ensure_future(read())
+        token = _request_queries.set(queries)
+        try:
+            await self.app(scope, receive_message, send)
+        finally:
+            _request_queries.reset(token)
+            reader.cancel()
+
+
+def statement_timeout(request: Request, timeouts: Dict[str, int]) -> int:
+    """Statement timeout of the endpoint, from the longest matching path prefix."""
+    route = request.scope.get("route")
+    path = route.path if route is not None else request.url.path
+    prefixes = [prefix for prefix in timeouts if path.startswith(prefix)]
+    return timeouts[max(prefixes, key=len)] if prefixes else 0
+
+
+class Replica:
+    """A read replica and its connection pool."""
+
+    def __init__(self, host: str, dsn: str):
+        """Initialize an unchecked replica, its pool is created by the health check."""
+        self.host = host
+        self.dsn = dsn
+        self.pool: Optional[asyncpg.Pool] = None
+        self.healthy = False
+        self.lag: Optional[float] = None
+        # Requests holding or waiting for a connection of the pool
+        self.outstanding = 0
+
+
+class ReaderPool:
+    """Connection pools of the read replicas.
+
+    Connections come from the healthy replica with the least outstanding requests.
+    A replica is ejected when its health check fails, when it lags more than
+    `max_lag` seconds behind the writer or when a connection cannot be acquired,
+    and is added back by the next successful health check. Without any healthy
+    replica the connections come from the `fallback` (writer) pool.
+    """
+
+    def __init__(
+        self,
+        replicas: List[Replica],
+        fallback: asyncpg.Pool,
+        settings: Settings,
+        max_lag: float,
+        check_interval: float,
+        check_timeout: float = 5,
+    ):
+        """Initialize the pool, replicas are used after the first health check."""
+        self.replicas = replicas
+        self.fallback = fallback
+        self.settings = settings
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self._checked_at = 0.0
+        self._check_task: Optional[asyncio.Task] = None
+
+    async def _replica_pool(self, replica: Replica) -> asyncpg.Pool:
+        # Created by the first check of the replica
+        if replica.pool is None:
+            replica.pool = await asyncio.wait_for(
+                DB().create_pool(replica.dsn, self.settings), self.check_timeout
+            )
+        return replica.pool
+
+    async def _check_replica(self, replica: Replica) -> None:
+        try:
+            pool = await self._replica_pool(replica)
+            lag = await asyncio.wait_for(
+                pool.fetchval(REPLICATION_LAG_SQL), self.check_timeout
+            )
+        except (*CONNECTION_ERRORS, asyncpg.PostgresError) as e:
+            self._eject(replica, e)
+            return
+
+        replica.lag = float(lag)
+        if replica.lag > self.max_lag:
+            self._eject(replica, f"{replica.lag:.1f}s replication lag")
+        elif not replica.healthy:
+            logger.info(f"Read replica {replica.host} is healthy")
+            replica.healthy = True
+
+    def _eject(self, replica: Replica, reason: object) -> None:
+        if replica.healthy:
+            logger.warning(f"Read replica {replica.host} ejected: {reason}")
+        replica.healthy = False
+
+    async def check(self) -> None:
+        """Check the health and replication lag of all the replicas."""
+        self._checked_at = time.monotonic()
+        await asyncio.gather(*[self._check_replica(r) for r in self.replicas])
+
+    def _schedule_check(self) -> None:
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+
+        if self._check_task is None or self._check_task.done():
+            self._check_task = asyncio.ensure_future(self.check())
+
+    def _pick(self) -> Optional[Replica]:
+        healthy = [r for r in self.replicas if r.healthy and r.pool is not None]
+        if not healthy:
+            return None
+
+        # Ties are broken randomly so that idle replicas share the load
+        return min(healthy, key=lambda r: (r.outstanding, random.random()))
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        """Acquire a connection from the least busy healthy replica."""
+        self._schedule_check()
+
+        while True:
+            replica = self._pick()
+            if replica is None:
+                async with self.fallback.acquire() as conn:
+                    yield conn
+                return
+
+            replica.outstanding += 1
+            try:
+                conn = await replica.pool.acquire()  # type: ignore
+            except CONNECTION_ERRORS as e:
+                replica.outstanding -= 1
+                self._eject(replica, e)
+                continue
+
+            try:
+                yield conn
+            finally:
+                replica.outstanding -= 1
+                await replica.pool.release(conn)  # type: ignore
+            return
+
+    def _pools(self) -> List[asyncpg.Pool]:
+        return [r.pool for r in self.replicas if r.pool is not None]
+
+    def get_size(self) -> int:
+        """Return the number of connections of the replica pools."""
+        return sum(pool.get_size() for pool in self._pools())
+
+    def get_idle_size(self) -> int:
+        """Return the number of idle connections of the replica pools."""
+        return sum(pool.get_idle_size() for pool in self._pools())
+
+    def get_max_size(self) -> int:
+        """Return the maximum number of connections of the replica pools."""
+        return sum(pool.get_max_size() for pool in self._pools())
+
+    async def close(self) -> None:
+        """Close the replica pools, the fallback pool is closed by its owner."""
+        if self._check_task is not None:
+            self._check_task.cancel()
+
+        for replica in self.replicas:
+            if replica.pool is not None:
+                await replica.pool.close()
+
+
+async def connect_to_db(
+    app: FastAPI,
+    reader_hosts: List[str],
+    max_lag: float,
+    check_interval: float,
+) -> None:
+    """Create the writer pool and the read pool, on the replicas if there are any."""
+    settings: Settings = app.state.settings
+    if not reader_hosts or settings.testing:
+        await pgstac_connect_to_db(app, get_conn=get_connection)
+        return
+
+    app.state.writepool = await DB().create_pool(
+        settings.writer_connection_string, settings
+    )
+    replicas = [
+        Replica(
+            host,
+            settings.copy(
+                update={"postgres_host_reader": host}
+            ).reader_connection_string,
+        )
+        for host in reader_hosts
+    ]
+    app.state.readpool = ReaderPool(
+        replicas,
+        app.state.writepool,
+        settings,
+        max_lag=max_lag,
+        check_interval=check_interval,
+    )
+    await app.state.readpool.check()
+    app.state.get_connection = get_connection
+
+
+def query_logger(pool: Any) -> Callable[[Any], None]:
+    """Query logger of the connections of a pool, for metrics and the slow log."""
+
+    def log_query(record: Any) -> None:
+        pool_metrics.log_query(record)
+        entry = slow_queries.record(record.query, record.args, record.elapsed * 1000)
+        if entry is not None and record.exception is None and slow_queries.sample():
+            slow_queries.explain_later(pool, entry, record.query, record.args)
+
+    return log_query
+
+
+@asynccontextmanager
+async def get_connection(
+    request: Request,
+    readwrite: Literal["r", "w"] = "r",
+) -> AsyncIterator[asyncpg.Connection]:
+    """Retrieve connection from database conection pool."""
+    if readwrite == "w":
+        name, pool = "write", request.app.state.writepool
+    else:
+        name, pool = "read", request.app.state.readpool
+
+    started = time.perf_counter()
+    with translate_pgstac_errors():
+        async with pool.acquire() as conn:
+            acquired = time.perf_counter()
+            pool_metrics.record(
+                f"DBPoolAcquireWait.{name}", (acquired - started) * 1000
+            )
+            pool_metrics.record_pool(name, pool)
+
+            # Reset (RESET ALL) when the connection is released to the pool
+            timeout = statement_timeout(request, api_settings.statement_timeouts)
+            if timeout:
+                await conn.execute(f"SET statement_timeout = {int(timeout)};")
+
+            # Cancelling the task cancels the running query
+            task = asyncio.current_task()
+            queries = _request_queries.get()
+            if queries is not None and task is not None:
+                queries.cancels.add(task.cancel)
+
+            try:
+                with conn.query_logger(query_logger(pool)):
+                    yield conn
+            except asyncio.CancelledError:
+                if queries is None or not queries.disconnected:
+                    raise
+                if hasattr(task, "uncancel"):
+                    task.uncancel()  # type: ignore
+                raise HTTPException(status_code=499, detail="Client closed request.")
+            except asyncpg.QueryCanceledError as e:
+                raise HTTPException(
+                    status_code=504, detail=f"Database query cancelled: {e}"
+                )
+            finally:
+                if queries is not None and task is not None:
+                    queries.cancels.discard(task.cancel)
+                pool_metrics.record(
+                    f"DBPoolCheckout.{name}", (time.perf_counter() - acquired) * 1000
+                )
+
+
+def pool_status(pool: Any) -> Dict[str, Any]:
+    """Describe the connections of a pool, for the debug endpoint."""
+    status: Dict[str, Any] = {
+        "size": pool.get_size(),
+        "idle": pool.get_idle_size(),
+        "max": pool.get_max_size(),
+    }
+    if isinstance(pool, ReaderPool):
+        status["replicas"] = [
+            {
+                "host": replica.host,
+                "healthy": replica.healthy,
+                "lag": replica.lag,
+                "outstanding": replica.outstanding,
+                **(pool_status(replica.pool) if replica.pool is not None else {}),
+            }
+            for replica in pool.replicas
+        ]
+
+    return status
@@ -0,0 +1,67 @@
+"""Geometry simplification extension."""
+
+from typing import List, Optional
+
+import attr
+from pydantic import BaseModel, confloat, conint
+
+from fastapi import FastAPI, Query
+from stac_fastapi.types.extension import ApiExtension
+from stac_fastapi.types.search import APIRequest
+
+MAX_GEOMETRY_PRECISION = 15
+
+
+@attr.s
+class GeometryExtensionGetRequest(APIRequest):
+    """Geometry simplification arguments for GET Request."""
+
+    simplify: Optional[float] = attr.ib(
+        default=Query(
+            None,
+            gt=0,
+            description="Simplify geometries with this tolerance, in degrees.",
+        )
+    )
+    precision: Optional[int] = attr.ib(
+        default=Query(
+            None,
+            ge=0,
+            le=MAX_GEOMETRY_PRECISION,
+            description="Round geometry coordinates to this number of decimal places.",
+        )
+    )
+
+
+class GeometryExtensionPostRequest(BaseModel):
+    """Geometry simplification arguments for POST Request."""
+
+    simplify: Optional[confloat(gt=0)]  # type: ignore
+    precision: Optional[conint(ge=0, le=MAX_GEOMETRY_PRECISION)]  # type: ignore
+
+
+@attr.s
+class GeometryExtension(ApiExtension):
+    """Geometry simplification extension.
+
+    Adds `simplify` (ST_SimplifyPreserveTopology tolerance) and `precision`
+    (ST_ReducePrecision decimal places) to `/search`, both applied by the database
+    before the items are serialized. Only the pgstac JSON passthrough of
+    `VedaCrudClient` applies them, API side hydration ignores them.
+    """
+
+    GET = GeometryExtensionGetRequest
+    POST = GeometryExtensionPostRequest
+
+    conformance_classes: List[str] = attr.ib(factory=list)
+    schema_href: Optional[str] = attr.ib(default=None)
+
+    def register(self, app: FastAPI) -> None:
+        """Register the extension with a FastAPI application.
+        Args:
+            app: target FastAPI application.
+        Returns:
+            None
+
+        """
+        pass
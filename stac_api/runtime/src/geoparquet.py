@@ -0,0 +1,334 @@
+"""stac-geoparquet export extension."""
+
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+import attr
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import shapely
+from asyncpg.exceptions import InvalidDatetimeFormatError
+from src.config import ApiSettings, post_request_model
+
+from fastapi import APIRouter, FastAPI
+from stac_fastapi.pgstac.types.search import PgstacSearch
+from stac_fastapi.types.errors import InvalidQueryParameter
+from stac_fastapi.types.extension import ApiExtension
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from . import pgsearch
+from .count import COUNT_SETTINGS, CountStrategy
+from .monitoring import LoggerRouteHandler, logger, tracer
+
+api_settings = ApiSettings()
+
+GEOPARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+# https://github.com/stac-utils/stac-geoparquet/blob/main/spec/stac-geoparquet-spec.md
+DATETIME_COLUMNS = {"datetime", "start_datetime", "end_datetime", "created", "updated"}
+GEO_METADATA = {
+    "version": "1.0.0",
+    "primary_column": "geometry",
+    "columns": {"geometry": {"encoding": "WKB", "geometry_types": []}},
+}
+STAC_GEOPARQUET_METADATA = {"version": "1.0.0"}
+
+
+class _StreamSink:
+    """Writable file object handing the bytes written by pyarrow back to a response stream."""
+
+    def __init__(self):
+        """Initialize an empty sink."""
+        self.buffer = bytearray()
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        """Append data to the buffer."""
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        """Return the number of bytes written so far."""
+        return self.position
+
+    def flush(self) -> None:
+        """Nothing to flush, bytes are drained by the response stream."""
+
+    def close(self) -> None:
+        """Mark the sink as closed."""
+        self.closed = True
+
+    def drain(self) -> bytes:
+        """Return and forget the bytes written since the last call."""
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def _json_text(values: List[Any]) -> pa.Array:
+    return pa.array(
+        [None if v is None else orjson.dumps(v).decode() for v in values],
+        type=pa.string(),
+    )
+
+
+def items_to_record_batch(features: List[Dict[str, Any]]) -> pa.RecordBatch:
+    """Convert a page of STAC items to an Arrow record batch.
+
+    Properties are lifted to top-level columns, the geometry is stored as WKB and the
+    bbox as a struct, following the stac-geoparquet spec. Column types are inferred
+    from the page, `export_schema` and `conform_batch` reconcile the pages.
+    """
+    rows = []
+    for feature in features:
+        row = {k: v for k, v in feature.items() if k not in ["properties", "bbox"]}
+        row.update(feature.get("properties") or {})
+
+        bbox = feature.get("bbox")
+        if bbox:
+            if len(bbox) == 6:
+                bbox = [bbox[0], bbox[1], bbox[3], bbox[4]]
+            row["bbox"] = dict(zip(["xmin", "ymin", "xmax", "ymax"], map(float, bbox)))
+
+        rows.append(row)
+
+    if any("geometry" in row for row in rows):
+        geometries = shapely.from_geojson(
+            [
+                orjson.dumps(row["geometry"]) if row.get("geometry") else None
+                for row in rows
+            ]
+        )
+        for row, wkb in zip(rows, shapely.to_wkb(geometries)):
+            row["geometry"] = wkb
+
+    if not rows:
+        return pa.RecordBatch.from_pylist([], schema=pa.schema([("id", pa.string())]))
+
+    columns = {}
+    for name in dict.fromkeys(name for row in rows for name in row):
+        values = [row.get(name) for row in rows]
+        try:
+            column = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Values of mixed types
+            column = _json_text(values)
+        if name in DATETIME_COLUMNS and pa.types.is_string(column.type):
+            column = pc.cast(column, pa.timestamp("us", tz="UTC"))
+        columns[name] = column
+
+    return pa.RecordBatch.from_arrays(list(columns.values()), names=list(columns))
+
+
+def _is_untyped(type: pa.DataType) -> bool:
+    """Check if a type is null, or a list of nulls, as inferred from null values."""
+    if pa.types.is_list(type) or pa.types.is_large_list(type):
+        return _is_untyped(type.value_type)
+    return pa.types.is_null(type)
+
+
+def export_schema(schemas: List[pa.Schema]) -> pa.Schema:
+    """Schema of an export, with the columns of all the schemas of its first batches.
+
+    Null typed columns take the type of the other batches, and are written as JSON
+    text if they are null (or empty lists) in all of them. Numbers are promoted to the widest type
+    and columns of otherwise incompatible types are written as JSON text.
+    """
+    types: Dict[str, pa.DataType] = {}
+    for schema in schemas:
+        for field in schema:
+            known = types.setdefault(field.name, field.type)
+            if known == field.type:
+                continue
+            try:
+                types[field.name] = (
+                    pa.unify_schemas(
+                        [pa.schema([(field.name, known)]), pa.schema([field])],
+                        promote_options="permissive",
+                    )
+                    .field(0)
+                    .type
+                )
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                types[field.name] = pa.string()
+
+    return pa.schema(
+        [
+            (name, pa.string() if _is_untyped(type) else type)
+            for name, type in types.items()
+        ]
+    )
+
+
+def conform_batch(
+    batch: pa.RecordBatch, schema: pa.Schema, dropped: Set[str]
+) -> pa.RecordBatch:
+    """Cast a record batch to the schema of an export.
+
+    Missing columns are null, values which cannot be cast are written as JSON text in
+    text columns and as nulls otherwise. Columns not in the schema are dropped, and
+    added to `dropped`.
+    """
+    new = set(batch.schema.names) - set(schema.names) - dropped
+    if new:
+        logger.warning(
+            f"Columns {sorted(new)} first appear after the export schema window,"
+            " they are not exported"
+        )
+        dropped.update(new)
+
+    arrays = []
+    for field in schema:
+        if field.name not in batch.schema.names:
+            arrays.append(pa.nulls(batch.num_rows, field.type))
+            continue
+
+        column = batch.column(field.name)
+        if column.type == field.type:
+            arrays.append(column)
+        elif pa.types.is_null(column.type):
+            arrays.append(pa.nulls(batch.num_rows, field.type))
+        elif pa.types.is_string(field.type):
+            arrays.append(_json_text(column.to_pylist()))
+        else:
+            try:
+                arrays.append(column.cast(field.type))
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                logger.warning(
+                    f"Column {field.name} values of type {column.type} cannot be"
+                    f" cast to {field.type}, they are not exported"
+                )
+                arrays.append(pa.nulls(batch.num_rows, field.type))
+
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+async def stream_geoparquet(
+    first_page: List[Dict[str, Any]], pages: AsyncIterator[List[Dict[str, Any]]]
+) -> AsyncIterator[bytes]:
+    """Write pages of STAC items as a stac-geoparquet file, one row group per page."""
+    # The columns of the file are those of the first batches, up to
+    # `export_schema_window` items, as a parquet schema cannot change
+    batches = [items_to_record_batch(first_page)]
+    buffered = batches[0].num_rows
+    while buffered < api_settings.export_schema_window:
+        try:
+            features = await pages.__anext__()
+        except StopAsyncIteration:
+            break
+        batches.append(items_to_record_batch(features))
+        buffered += batches[-1].num_rows
+
+    schema = export_schema([batch.schema for batch in batches])
+    schema = schema.with_metadata(
+        {
+            "geo": orjson.dumps(GEO_METADATA),
+            "stac-geoparquet": orjson.dumps(STAC_GEOPARQUET_METADATA),
+        }
+    )
+    dropped: Set[str] = set()
+    sink = _StreamSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for batch in batches:
+            writer.write_batch(conform_batch(batch, schema, dropped))
+            yield sink.drain()
+        del batches
+
+        async for features in pages:
+            batch = items_to_record_batch(features)
+            writer.write_batch(conform_batch(batch, schema, dropped))
+            yield sink.drain()
+
+    yield sink.drain()
+
+
+@attr.s
+class GeoParquetExtension(ApiExtension):
+    """Export search results as stac-geoparquet."""
+
+    def register(self, app: FastAPI) -> None:
+        """Register the extension with a FastAPI application.
+        Args:
+            app: target FastAPI application.
+        Returns:
+            None
+
+        """
+        router = APIRouter(route_class=LoggerRouteHandler)
+
+        async def _search_pages(
+            search_request: PgstacSearch, request: Request
+        ) -> AsyncIterator[List[Dict[str, Any]]]:
+            """Page through the search results, one page per batch."""
+            search_request.conf = search_request.conf or {}
+            search_request.conf["nohydrate"] = False
+            # numberMatched is never returned by the export, don't pay for it
+            search_request.conf["context"] = "off"
+            search_request.limit = api_settings.export_batch_size
+            req = search_request.json(exclude_none=True, by_alias=True)
+
+            try:
+                registration = await pgsearch.register(
+                    request, req, COUNT_SETTINGS[CountStrategy.none]
+                )
+            except InvalidDatetimeFormatError:
+                raise InvalidQueryParameter(
+                    f"Datetime parameter {search_request.datetime} is invalid."
+                )
+
+            # The pages are read from the read replicas, the search is registered once
+            while True:
+                meta, rows = await pgsearch.page(
+                    request, req, registration, columns="feature.f AS feature"
+                )
+                if rows:
+                    yield [row["feature"] for row in rows]
+
+                next: Optional[str] = meta.get("next")
+                if not next:
+                    break
+
+                search_request.token = f"next:{next}"
+                req = search_request.json(exclude_none=True, by_alias=True)
+
+        @router.post(
+            "/search/geoparquet",
+            response_class=StreamingResponse,
+            responses={
+                200: {
+                    "description": "Search results as stac-geoparquet.",
+                    "content": {GEOPARQUET_MEDIA_TYPE: {}},
+                }
+            },
+        )
+        @tracer.capture_method
+        async def search_geoparquet(
+            request: Request,
+            search_request: post_request_model,  # type: ignore
+        ):
+            """Stream all the items matching a search as a stac-geoparquet file.
+
+            Items are converted and written one record batch (row group) at a time,
+            `limit` is ignored and the fields extension controls the exported columns.
+            """
+            pages = _search_pages(search_request, request)
+            # Fetch the first page before streaming so that query errors can still be
+            # reported with a proper status code.
+            try:
+                first_page = await pages.__anext__()
+            except StopAsyncIteration:
+                first_page = []
+
+            return StreamingResponse(
+                stream_geoparquet(first_page, pages),
+                media_type=GEOPARQUET_MEDIA_TYPE,
+                headers={
+                    "Content-Disposition": 'attachment; filename="search.parquet"'
+                },
+            )
+
+        app.include_router(router, tags=["GeoParquet Extension"])
@@ -0,0 +1,163 @@
+"""Bulk ingest extension."""
+
+import time
+from typing import Any, AsyncIterator, Dict, List
+
+import attr
+import orjson
+from pydantic import ValidationError
+from pypgstac.db import PgstacDB
+from pypgstac.load import Loader, Methods
+from src.config import ApiSettings
+from stac_pydantic import Item
+
+from fastapi import APIRouter, FastAPI, HTTPException, Query
+from stac_fastapi.types.extension import ApiExtension
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from .monitoring import LoggerRouteHandler, MetricUnit, metrics, tracer
+
+api_settings = ApiSettings()
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def read_ndjson(request: Request) -> AsyncIterator[Dict[str, Any]]:
+    """Yield the records of a NDJSON request body without reading it all in memory."""
+    remainder = b""
+    async for chunk in request.stream():
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield orjson.loads(line)
+
+    if remainder.strip():
+        yield orjson.loads(remainder)
+
+
+def validate_batch(items: List[Dict[str, Any]], loaded: int) -> None:
+    """Validate a batch of items against the STAC item model."""
+    for i, item in enumerate(items):
+        try:
+            Item.parse_obj(item)
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid item {item.get('id')} (record {loaded + i + 1}): {e}. "
+                f"{loaded} items were loaded before the error.",
+            )
+
+
+def load_batch(db: PgstacDB, items: List[Dict[str, Any]], method: Methods) -> None:
+    """Load a batch of items with pypgstac (rows grouped by partition and COPYed)."""
+    Loader(db=db).load_items(iter(items), insert_mode=method, chunksize=len(items))
+
+
+def close_db(db: PgstacDB) -> None:
+    """Release the loader connection and its pool."""
+    pool = db.pool
+    db.disconnect()
+    if pool is not None:
+        pool.close()
+
+
+async def ingest_batch(
+    db: PgstacDB, items: List[Dict[str, Any]], method: Methods, loaded: int
+) -> Dict[str, Any]:
+    """Validate and load one batch of items, returning its timings."""
+    validate_start = time.perf_counter()
+    validate_batch(items, loaded)
+    validate_time = time.perf_counter() - validate_start
+
+    load_start = time.perf_counter()
+    try:
+        await run_in_threadpool(load_batch, db, items, method)
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unable to load records {loaded + 1} to {loaded + len(items)}: {e}. "
+            f"{loaded} items were loaded before the error.",
+        )
+    load_time = time.perf_counter() - load_start
+
+    metrics.add_metric(name="IngestedItems", unit=MetricUnit.Count, value=len(items))
+    return {
+        "items": len(items),
+        "validate_time": round(validate_time, 4),
+        "load_time": round(load_time, 4),
+    }
+
+
+@attr.s
+class BulkIngestExtension(ApiExtension):
+    """Bulk ingest of NDJSON item streams through pypgstac's loader."""
+
+    def register(self, app: FastAPI) -> None:
+        """Register the extension with a FastAPI application.
+        Args:
+            app: target FastAPI application.
+        Returns:
+            None
+
+        """
+        router = APIRouter(route_class=LoggerRouteHandler)
+
+        @router.post(
+            "/bulk-ingest",
+            openapi_extra={
+                "requestBody": {
+                    "content": {NDJSON_MEDIA_TYPE: {"schema": {"type": "string"}}},
+                    "required": True,
+                },
+            },
+        )
+        @tracer.capture_method
+        async def bulk_ingest(
+            request: Request,
+            method: Methods = Query(
+                Methods.insert, description="pypgstac load method."
+            ),
+            batch_size: int = Query(
+                api_settings.ingest_batch_size,
+                gt=0,
+                le=10000,
+                description="Number of items validated and loaded together.",
+            ),
+        ):
+            """Validate and load a stream of NDJSON items, one batch at a time."""
+            settings = request.app.state.settings
+            db = PgstacDB(dsn=settings.writer_connection_string)
+
+            batches: List[Dict[str, Any]] = []
+            batch: List[Dict[str, Any]] = []
+            count = 0
+            try:
+                async for item in read_ndjson(request):
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        batches.append(await ingest_batch(db, batch, method, count))
+                        count += len(batch)
+                        batch = []
+
+                if batch:
+                    batches.append(await ingest_batch(db, batch, method, count))
+                    count += len(batch)
+
+            except orjson.JSONDecodeError as e:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid NDJSON record after record {count + len(batch)}: {e}",
+                )
+
+            finally:
+                await run_in_threadpool(close_db, db)
+
+            return {
+                "method": method.value,
+                "items": count,
+                "batches": batches,
+            }
+
+        app.include_router(router, tags=["Bulk Ingest Extension"])
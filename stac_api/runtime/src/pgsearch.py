@@ -0,0 +1,187 @@
+"""pgstac searches, registered on the writer and read from the read replicas.
+
+pgstac (0.7) `search()` registers the search and its statistics in the `searches`
+and `search_wheres` tables, which a hot standby refuses. The registration (with
+the count) runs on the writer, and the page of items is read from a replica with
+the read only parts of `search()`: the token filter, `search_rows` and
+`format_item`.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncpg
+import attr
+import orjson
+from buildpg import render
+
+from starlette.requests import Request
+
+# The context settings of the count strategy are set before the search is
+# registered, `where_stats` runs the count (or the estimate) as `search()` does.
+REGISTER_SQL = """
+    WITH settings AS MATERIALIZED (
+        SELECT set_config('pgstac.' || key, value, true)
+        FROM jsonb_each_text(:settings::text::jsonb)
+    ),
+    registered AS MATERIALIZED (
+        SELECT search_query(:req::text::jsonb) AS s
+        FROM (SELECT count(*) FROM settings) AS c
+    )
+    SELECT
+        (registered.s)._where AS _where,
+        (registered.s).orderby AS orderby,
+        coalesce(stats.total_count, stats.estimated_count) AS matched,
+        context((:req::text::jsonb)->'conf') != 'off' AS context
+    FROM registered, where_stats((registered.s)._where) AS stats;
+"""
+
+PAGE_SQL = """
+    WITH token AS (
+        SELECT t.prev, t.item FROM get_token_record(:token::text) AS t
+    ),
+    page AS (
+        SELECT
+            coalesce(token.prev, false) AS prev,
+            (token.item).id AS token_id,
+            (token.item).collection AS token_collection,
+            concat_ws(
+                ' AND ',
+                :where::text,
+                CASE WHEN (token.item).id IS NOT NULL THEN get_token_filter(
+                    (:req::text::jsonb)->'sortby', token.item, token.prev, false
+                ) END
+            ) AS full_where,
+            CASE WHEN token.prev
+                THEN sort_sqlorderby(:req::text::jsonb, true)
+                ELSE :orderby::text
+            END AS orderby
+        FROM token
+    )
+    SELECT
+        page.prev,
+        page.token_id,
+        page.token_collection,
+        feature.n,
+        feature.f->>'id' AS id,
+        feature.f->>'collection' AS collection
+        {columns}
+    FROM page
+    LEFT JOIN LATERAL (
+        SELECT jsonb_agg(format_item(
+            i, coalesce((:req::text::jsonb)->'fields', '{{}}'::jsonb), :hydrate
+        )) AS features
+        FROM search_rows(page.full_where, page.orderby, NULL, :limit) AS i
+    ) AS r ON TRUE
+    LEFT JOIN LATERAL jsonb_array_elements(r.features)
+        WITH ORDINALITY AS feature(f, n) ON TRUE
+    ORDER BY feature.n;
+"""
+
+
+@attr.s
+class Registration:
+    """A registered search: its where clause, order and count."""
+
+    where: str = attr.ib()
+    orderby: str = attr.ib()
+    matched: Optional[int] = attr.ib(default=None)
+    context: bool = attr.ib(default=True)
+
+
+async def register(
+    request: Request, req: str, settings: Optional[Dict[str, str]] = None
+) -> Registration:
+    """Register a search, and count its items, on the writer."""
+    async with request.app.state.get_connection(request, "w") as conn:
+        q, p = render(
+            REGISTER_SQL, req=req, settings=orjson.dumps(settings or {}).decode()
+        )
+        row = await conn.fetchrow(q, *p)
+
+    return Registration(
+        where=row["_where"],
+        orderby=row["orderby"],
+        matched=row["matched"],
+        context=row["context"],
+    )
+
+
+async def page(
+    request: Request,
+    req: str,
+    registration: Registration,
+    columns: str = "",
+    **params: Any,
+) -> Tuple[Dict[str, Any], List[asyncpg.Record]]:
+    """Read a page of a registered search from a read replica.
+
+    Returns the search metadata (as returned by pgstac `search()`, without the
+    features) and one row per item, with the `id`, `collection` and the extra
+    `columns` selected from the item JSON `feature.f`.
+    """
+    search = orjson.loads(req)
+    conf = search.get("conf") or {}
+    limit = int(search.get("limit") or 10)
+
+    async with request.app.state.get_connection(request, "r") as conn:
+        q, p = render(
+            PAGE_SQL.format(columns=f", {columns}" if columns else ""),
+            req=req,
+            token=search.get("token"),
+            where=registration.where,
+            orderby=registration.orderby,
+            hydrate=not conf.get("nohydrate", False),
+            limit=limit + 1,
+            **params,
+        )
+        rows = await conn.fetch(q, *p)
+
+    token_prev = bool(rows[0]["prev"])
+    token = (rows[0]["token_collection"], rows[0]["token_id"])
+    features = [row for row in rows if row["n"] is not None]
+    if token_prev:
+        features.reverse()
+
+    # The item of the token is not part of the page
+    if features and (features[0]["collection"], features[0]["id"]) == token:
+        features = features[1:]
+    elif features and (features[-1]["collection"], features[-1]["id"]) == token:
+        features = features[:-1]
+
+    has_prev = token[1] is not None and not token_prev
+    has_next = token_prev
+    if len(features) == limit + 1:
+        if token_prev:
+            has_prev = True
+            features = features[1:]
+        else:
+            has_next = True
+            features = features[:-1]
+
+    context: Dict[str, Any] = {"limit": limit, "returned": len(features)}
+    if registration.context and registration.matched is not None:
+        context["matched"] = registration.matched
+
+    meta = {
+        "type": "FeatureCollection",
+        "next": _token(features[-1]) if has_next and features else None,
+        "prev": _token(features[0]) if has_prev and features else None,
+        "context": context,
+    }
+    return meta, features
+
+
+def _token(row: asyncpg.Record) -> str:
+    return f"{row['collection']}:{row['id']}"
+
+
+async def search(
+    request: Request,
+    req: str,
+    settings: Optional[Dict[str, str]] = None,
+    columns: str = "",
+    **params: Any,
+) -> Tuple[Dict[str, Any], List[asyncpg.Record]]:
+    """Register a search on the writer and read its page from a read replica."""
+    registration = await register(request, req, settings)
+    return await page(request, req, registration, columns, **params)
@@ -1,6 +1,7 @@
 """Custom search models"""
 
 from datetime import datetime as dt
+from enum import Enum
 from typing import Dict, Optional, Union
 
 import attr
@@ -14,12 +15,19 @@ from geojson_pydantic.geometries import (  # type: ignore
     Polygon,
     _GeometryBase,
 )
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, conlist, validator
 from stac_pydantic.shared import BBox
 
+from fastapi import Path
+from stac_fastapi.api.models import CollectionUri
 from stac_fastapi.types.rfc3339 import rfc3339_str_to_datetime, str_to_interval
 from stac_fastapi.types.search import APIRequest, str2list
 
+from .count import CountStrategy
+
+MAX_BULK_ITEMS = 100
+MAX_TILE_ZOOM = 22
+
 Intersection = Union[
     Point,
     MultiPoint,
@@ -40,6 +48,7 @@ class CollectionSearchPost(BaseModel):
     intersects: Optional[Intersection]
     datetime: Optional[str]
     conf: Optional[Dict] = None
+    count: Optional[CountStrategy] = None
 
     @property
     def start_date(self) -> Optional[dt]:
@@ -149,3 +158,67 @@ class CollectionSearchGet(APIRequest):
     bbox: Optional[str] = attr.ib(default=None, converter=str2list)  # type: ignore
     intersects: Optional[str] = attr.ib(default=None, converter=str2list)  # type: ignore
     datetime: Optional[str] = attr.ib(default=None)
+    count: Optional[CountStrategy] = attr.ib(default=None)
+
+
+class ItemReference(BaseModel):
+    """Collection and item ID pair."""
+
+    collection: str
+    id: str
+
+
+class BulkItemsPost(BaseModel):
+    """
+    The class for bulk item requests.
+    """
+
+    items: conlist(ItemReference, min_items=1, max_items=MAX_BULK_ITEMS)  # type: ignore
+
+
+@attr.s
+class BulkItemsGet(APIRequest):
+    """Base arguments for bulk item GET Request."""
+
+    ids: Optional[str] = attr.ib(default=None, converter=str2list)  # type: ignore
+
+
+class HistogramInterval(str, Enum):
+    """Datetime histogram bucket sizes."""
+
+    day = "day"
+    month = "month"
+    year = "year"
+
+
+@attr.s
+class DatetimeHistogramGet(CollectionUri):
+    """Arguments for the collection datetime histogram GET Request."""
+
+    interval: HistogramInterval = attr.ib(default=HistogramInterval.day)
+    bbox: Optional[str] = attr.ib(default=None, converter=str2list)  # type: ignore
+    datetime: Optional[str] = attr.ib(default=None)
+
+
+@attr.s
+class TileUri(APIRequest):
+    """Base arguments for vector tile GET Request."""
+
+    z: int = attr.ib(default=Path(..., ge=0, le=MAX_TILE_ZOOM, description="Zoom"))
+    x: int = attr.ib(default=Path(..., ge=0, description="Column"))
+    y: int = attr.ib(default=Path(..., ge=0, description="Row"))
+    properties: Optional[str] = attr.ib(default=None, converter=str2list)  # type: ignore
+
+
+@attr.s
+class CollectionTileGet(TileUri):
+    """Arguments for the collection vector tile GET Request."""
+
+    collection_id: str = attr.ib(default=Path(..., description="Collection ID"))
+
+
+@attr.s
+class SearchTileGet(TileUri):
+    """Arguments for the search vector tile GET Request."""
+
+    search_id: str = attr.ib(default=Path(..., description="Search hash"))
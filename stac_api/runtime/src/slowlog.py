@@ -0,0 +1,165 @@
+"""Slow query log."""
+
+import asyncio
+import random
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+import asyncpg
+import orjson
+
+from .config import ApiSettings
+from .monitoring import logger, sql_function
+
+# Arguments longer than this (e.g. ingested items) are truncated in the log
+MAX_ARGUMENT_LENGTH = 2000
+
+# pgstac search functions, explained through the items query they run
+SEARCH_FUNCTIONS = {"search", "search_query", "search_rows", "collection_id_search"}
+
+
+def normalize_argument(arg: Any) -> Any:
+    """Normalize a query argument for the log.
+
+    JSON objects (pgstac searches) are parsed, without their paging token and with
+    sorted keys, so that the same search logs the same way on every page.
+    """
+    if not isinstance(arg, str):
+        return arg
+
+    if arg.startswith("{") and len(arg) <= MAX_ARGUMENT_LENGTH:
+        try:
+            value = orjson.loads(arg)
+        except orjson.JSONDecodeError:
+            return arg
+
+        if isinstance(value, dict):
+            value.pop("token", None)
+            return orjson.loads(orjson.dumps(value, option=orjson.OPT_SORT_KEYS))
+
+    if len(arg) > MAX_ARGUMENT_LENGTH:
+        return arg[:MAX_ARGUMENT_LENGTH] + "..."
+
+    return arg
+
+
+class SlowQueryLog:
+    """Queries slower than `threshold_ms`, kept in a bounded in-memory ring buffer.
+
+    Slow queries are logged and a `explain_rate` fraction of them is explained
+    (`EXPLAIN (ANALYZE, BUFFERS)`) on a separate connection, within a transaction
+    which is rolled back. pgstac searches are explained through the items query
+    built from their `search_query()` where and order by clauses, the plan of the
+    function call itself would be a single function scan.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float,
+        explain_rate: float,
+        size: int,
+        explain_timeout_ms: int = 30000,
+    ):
+        """Initialize an empty log."""
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.explain_timeout_ms = explain_timeout_ms
+        self.entries: Deque[Dict[str, Any]] = deque(maxlen=size)
+        # Explain tasks, referenced until done
+        self._tasks: set = set()
+
+    def record(
+        self, query: str, args: Sequence[Any], ms: float
+    ) -> Optional[Dict[str, Any]]:
+        """Log the query if it is slow, returns the log entry."""
+        if self.threshold_ms <= 0 or ms < self.threshold_ms:
+            return None
+
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "function": sql_function(query),
+            "ms": round(ms, 3),
+            "query": " ".join(query.split()),
+            "args": [normalize_argument(arg) for arg in args],
+            "plan": None,
+        }
+        self.entries.append(entry)
+        logger.warning("Slow query", extra={"slow_query": entry})
+        return entry
+
+    def sample(self) -> bool:
+        """Check if a slow query should be explained."""
+        return random.random() < self.explain_rate
+
+    def _items_query(self, function: str, row: Any, limit: int) -> str:
+        if function == "collection_id_search":
+            return f"SELECT DISTINCT collection FROM items WHERE {row['_where']}"
+        if function == "search_query":
+            # The registration of a search runs its count
+            return f"SELECT count(*) FROM items WHERE {row['_where']}"
+
+        return (
+            f"SELECT * FROM items WHERE {row['_where']} "
+            f"ORDER BY {row['orderby']} LIMIT {limit}"
+        )
+
+    async def explain(
+        self, pool: Any, entry: Dict[str, Any], query: str, args: Sequence[Any]
+    ) -> None:
+        """Add the plan of a slow query to its log entry."""
+        try:
+            async with pool.acquire() as conn:
+                transaction = conn.transaction()
+                await transaction.start()
+                try:
+                    await conn.execute(
+                        f"SET LOCAL statement_timeout = {int(self.explain_timeout_ms)};"
+                    )
+                    if entry["function"] in SEARCH_FUNCTIONS:
+                        # The search is the last JSON argument, after the settings
+                        search = [a for a in args if str(a).startswith("{")][-1]
+                        # Not search_query(), which writes and would fail on a replica
+                        row = await conn.fetchrow(
+                            """
+                            SELECT
+                                stac_search_to_where($1::text::jsonb) AS _where,
+                                sort_sqlorderby($1::text::jsonb) AS orderby;
+                            """,
+                            search,
+                        )
+                        limit = int(orjson.loads(search).get("limit") or 10)
+                        query = self._items_query(entry["function"], row, limit)
+                        args = []
+
+                    plan = await conn.fetchval(
+                        f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", *args
+                    )
+                finally:
+                    await transaction.rollback()
+        except (OSError, IndexError, asyncpg.PostgresError) as e:
+            entry["plan"] = {"error": str(e)}
+            return
+
+        entry["plan"] = plan
+        logger.warning("Slow query plan", extra={"slow_query": entry})
+
+    def explain_later(
+        self, pool: Any, entry: Dict[str, Any], query: str, args: Sequence[Any]
+    ) -> None:
+        """Explain a slow query in the background."""
+        task = asyncio.ensure_future(self.explain(pool, entry, query, args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def recent(self) -> List[Dict[str, Any]]:
+        """Return the log entries, most recent first."""
+        return list(reversed(self.entries))
+
+
+api_settings = ApiSettings()
+slow_queries = SlowQueryLog(
+    threshold_ms=api_settings.slow_query_ms,
+    explain_rate=api_settings.slow_query_explain_rate,
+    size=api_settings.slow_query_log_size,
+)
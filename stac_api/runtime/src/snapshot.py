@@ -0,0 +1,132 @@
+"""In-process snapshot of the pgstac collections."""
+
+import asyncio
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import asyncpg
+import orjson
+
+from starlette.requests import Request
+
+from .cache import TTLCache
+from .monitoring import logger
+
+# Channel notified by the `collections_notify_trigger` of the database bootstrap
+COLLECTIONS_CHANNEL = "pgstac_collections"
+
+
+class CollectionsSnapshot:
+    """All the collections of the catalog, held in memory.
+
+    The snapshot is dropped when the database notifies a change to the collections
+    table and, since a Lambda container may miss notifications while it is frozen,
+    after `ttl` seconds. The serialized responses (with their links, which depend
+    on the request base URL) and their ETags are kept alongside the snapshot, the
+    `rendered_size` most recently used ones since the base URL comes from the
+    request headers.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        channel: str = COLLECTIONS_CHANNEL,
+        rendered_size: int = 1024,
+    ):
+        """Initialize an empty snapshot."""
+        self.ttl = ttl
+        self.channel = channel
+        self._collections: Optional[Dict[str, Dict[str, Any]]] = None
+        self._loaded_at = 0.0
+        self._version = 0
+        self._rendered = TTLCache(ttl=ttl, maxsize=rendered_size)
+        # Created on first use, within the running event loop
+        self._lock: Optional[asyncio.Lock] = None
+        self._dsn: Optional[str] = None
+        self._listener: Optional[asyncpg.Connection] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Check if collections are served from the snapshot."""
+        return self.ttl > 0
+
+    def invalidate(self, *args: Any) -> None:
+        """Drop the snapshot, called with the arguments of an asyncpg listener."""
+        self._version += 1
+        self._collections = None
+        self._rendered.clear()
+
+    async def listen(self, dsn: str) -> None:
+        """Open the connection listening to collection changes."""
+        self._dsn = dsn
+        if not self.enabled:
+            return
+
+        try:
+            self._listener = await asyncpg.connect(dsn)
+            await self._listener.add_listener(self.channel, self.invalidate)
+        except (OSError, asyncpg.PostgresError) as e:
+            # The TTL still bounds how stale the snapshot can be
+            logger.warning(f"Unable to listen to collection changes: {e}")
+            self._listener = None
+
+    async def close(self) -> None:
+        """Close the listening connection."""
+        if self._listener is not None and not self._listener.is_closed():
+            await self._listener.close()
+        self._listener = None
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._collections is not None
+            and time.monotonic() - self._loaded_at < self.ttl
+        )
+
+    async def _load(self, request: Request) -> None:
+        if self._dsn and (self._listener is None or self._listener.is_closed()):
+            # Missed notifications are covered by the reload below
+            await self.listen(self._dsn)
+
+        version = self._version
+        # From the writer, a lagging replica would cache the collections from
+        # before a notified change for the whole TTL
+        async with request.app.state.get_connection(request, "w") as conn:
+            collections = await conn.fetchval(
+                """
+                SELECT * FROM all_collections();
+                """
+            )
+
+        self._rendered.clear()
+        self._collections = {c["id"]: c for c in collections or []}
+        # A change notified during the load leaves the snapshot stale
+        self._loaded_at = time.monotonic() if version == self._version else 0.0
+
+    async def get(self, request: Request) -> Dict[str, Dict[str, Any]]:
+        """Return the collections by id, loading them if the snapshot is stale."""
+        if not self._is_fresh():
+            self._lock = self._lock or asyncio.Lock()
+            async with self._lock:
+                if not self._is_fresh():
+                    await self._load(request)
+
+        return self._collections  # type: ignore
+
+    async def rendered(
+        self,
+        request: Request,
+        key: Hashable,
+        build: Callable[[], Awaitable[Any]],
+    ) -> Tuple[bytes, str]:
+        """Return a serialized response and its ETag, built once per snapshot."""
+        await self.get(request)
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            version = self._version
+            content = orjson.dumps(await build())
+            rendered = (content, f'"{hashlib.sha1(content).hexdigest()}"')
+            if version == self._version:
+                self._rendered.set(key, rendered)
+
+        return rendered
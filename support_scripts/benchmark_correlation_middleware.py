@@ -0,0 +1,173 @@
+"""
+Benchmark the correlation id middleware of the STAC API, before (BaseHTTPMiddleware)
+and after (pure ASGI), on the raw requests/s and the response streaming latency.
+
+Run from `stac_api/runtime`, with the API dependencies installed:
+
+    python ../../support_scripts/benchmark_correlation_middleware.py
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from src.monitoring import CorrelationIdMiddleware, logger, tracer
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "-n",
+    "--requests",
+    dest="requests",
+    type=int,
+    default=5000,
+    help="Number of requests of each run",
+)
+parser.add_argument(
+    "-c",
+    "--chunks",
+    dest="chunks",
+    type=int,
+    default=20,
+    help="Number of body chunks of the streamed responses",
+)
+parser.add_argument(
+    "--concurrency",
+    dest="concurrency",
+    type=int,
+    default=10,
+    help="Number of concurrent requests",
+)
+
+
+async def add_correlation_id(request: Request, call_next):
+    """The BaseHTTPMiddleware version of the middleware, as it was in `app.py`"""
+    corr_id = request.headers.get("x-correlation-id")
+    if not corr_id:
+        try:
+            corr_id = request.scope["aws.context"].aws_request_id
+        except KeyError:
+            corr_id = "local"
+    logger.set_correlation_id(corr_id)
+    tracer.put_annotation(key="correlation_id", value=corr_id)
+
+    response = await tracer.capture_method(call_next)(request)
+    response.headers["X-Correlation-Id"] = corr_id
+    logger.info("Request completed")
+    return response
+
+
+def create_app(chunks: int) -> Starlette:
+    """Application with a plain and a streaming endpoint."""
+
+    async def ping(request: Request):
+        return PlainTextResponse("pong")
+
+    async def stream(request: Request):
+        async def body():
+            for _ in range(chunks):
+                await asyncio.sleep(0)
+                yield b"x" * 1024
+
+        return StreamingResponse(body(), media_type="application/octet-stream")
+
+    return Starlette(routes=[Route("/ping", ping), Route("/stream", stream)])
+
+
+async def request(app: Callable, path: str) -> Dict[str, float]:
+    """Send a request, returns its time to the first body chunk and to the end."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"localhost"), (b"x-correlation-id", b"benchmark")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("localhost", 80),
+    }
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            # Like a server, the client stays connected until the response is sent
+            await asyncio.Event().wait()
+        received = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            timings.setdefault("first_chunk", time.perf_counter() - started)
+
+    await app(scope, receive, send)
+    timings["total"] = time.perf_counter() - started
+    return timings
+
+
+async def run(
+    app: Callable, path: str, requests: int, concurrency: int
+) -> Dict[str, float]:
+    """Send `requests` requests, `concurrency` at a time."""
+    results: List[Dict[str, float]] = []
+
+    async def worker(count: int) -> None:
+        for _ in range(count):
+            results.append(await request(app, path))
+
+    # Warm up
+    await request(app, path)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker(requests // concurrency) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    first_chunk = sorted(r["first_chunk"] * 1000 for r in results)
+    return {
+        "requests/s": len(results) / elapsed,
+        "first chunk p50 (ms)": statistics.median(first_chunk),
+        "first chunk p99 (ms)": first_chunk[int(len(first_chunk) * 0.99) - 1],
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run the benchmark on the application without, before and after."""
+    # Logging would dominate the timings
+    logger.setLevel("WARNING")
+
+    baseline = create_app(args.chunks)
+    before = create_app(args.chunks)
+    before.middleware("http")(add_correlation_id)
+    after = create_app(args.chunks)
+    after.add_middleware(CorrelationIdMiddleware)
+
+    apps: Dict[str, Callable[..., Awaitable[None]]] = {
+        "no middleware": baseline,
+        "before (BaseHTTPMiddleware)": before,
+        "after (pure ASGI)": after,
+    }
+    for path in ["/ping", "/stream"]:
+        print(f"GET {path}", flush=True)
+        for name, app in apps.items():
+            result = await run(app, path, args.requests, args.concurrency)
+            print(
+                f"  {name:<30}"
+                + "  ".join(f"{key}: {value:9.3f}" for key, value in result.items()),
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parser.parse_args()))
@@ -49,6 +49,13 @@ class PostgreSQLCommandRunner(metaclass=abc.ABCMeta):
             "sql_command attribute must be implemented in the child class"
         )
 
+    @classmethod
+    def add_arguments(cls, parser: argparse.ArgumentParser) -> None:
+        """Add command line arguments specific to the child class."""
+
+    def configure(self, args: argparse.Namespace) -> None:
+        """Read the command line arguments specific to the child class."""
+
     @classmethod
     def from_args(cls) -> "PostgreSQLCommandRunner":
         """Create a PostgreSQLCommandRunner from command line arguments."""
@@ -58,15 +65,18 @@ class PostgreSQLCommandRunner(metaclass=abc.ABCMeta):
         parser.add_argument("--database", type=str, help="PostgreSQL database")
         parser.add_argument("--user", type=str, help="PostgreSQL username")
         parser.add_argument("--password", type=str, help="PostgreSQL password")
+        cls.add_arguments(parser)
         args = parser.parse_args()
 
-        return cls(
+        runner = cls(
             host=args.host,
             port=args.port,
             database=args.database,
             user=args.user,
             password=args.password,
         )
+        runner.configure(args)
+        return runner
 
     @classmethod
     def from_conn_string(cls) -> "PostgreSQLCommandRunner":
@@ -77,6 +87,7 @@ class PostgreSQLCommandRunner(metaclass=abc.ABCMeta):
         parser.add_argument(
             "--connection_string", type=str, help="PostgreSQL connection string"
         )
+        cls.add_arguments(parser)
         args = parser.parse_args()
         connection_string = args.connection_string
         parts = connection_string.split("://")
@@ -90,6 +101,8 @@ class PostgreSQLCommandRunner(metaclass=abc.ABCMeta):
         host, port = host_parts[0].split(":")
         database = host_parts[1]
 
-        return cls(
+        runner = cls(
             host=host, port=port, database=database, user=username, password=password
         )
+        runner.configure(args)
+        return runner
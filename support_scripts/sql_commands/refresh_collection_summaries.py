@@ -0,0 +1,143 @@
+"""
+This script refreshes the default datetime summaries of dashboard collections, in parallel.
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Tuple
+
+import psycopg2
+from postgres_runner import PostgreSQLCommandRunner
+from psycopg2.pool import ThreadedConnectionPool
+
+# Collections whose item datetimes changed since their last summary, with a
+# partition not tracked by the datetimes triggers yet, or with a tracked partition
+# that has been dropped since.
+STALE_COLLECTIONS_SQL = """
+    SELECT c.id FROM pgstac.collections c
+    WHERE c.content ?| array['dashboard:is_periodic']
+    AND (
+        %(force)s
+        OR EXISTS (
+            SELECT 1 FROM dashboard.item_datetimes_collections s
+            WHERE s.collection = c.id AND s.changes > s.summarized
+        )
+        OR EXISTS (
+            SELECT 1 FROM pgstac.partitions_view pv
+            LEFT JOIN dashboard.item_datetimes_partitions dp USING (partition)
+            WHERE pv.collection = c.id AND dp.partition IS NULL
+        )
+        OR EXISTS (
+            SELECT 1 FROM dashboard.item_datetimes_partitions dp
+            WHERE dp.collection = c.id
+            AND NOT EXISTS (
+                SELECT 1 FROM pgstac.partitions_view pv WHERE pv.partition = dp.partition
+            )
+        )
+    )
+    ORDER BY c.id;
+"""
+
+
+class CollectionSummariesRefresh(PostgreSQLCommandRunner):
+    """This class refreshes the summaries of the collections whose items changed, each in its own transaction."""
+
+    workers = 4
+    force = False
+
+    @classmethod
+    def add_arguments(cls, parser: argparse.ArgumentParser) -> None:
+        """Add the refresh command line arguments."""
+        parser.add_argument(
+            "--workers", type=int, default=cls.workers, help="Concurrent connections"
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Refresh every collection, changed or not",
+        )
+
+    def configure(self, args: argparse.Namespace) -> None:
+        """Read the refresh command line arguments."""
+        self.workers = args.workers
+        self.force = args.force
+
+    @property
+    def sql_commands(self) -> List[str]:
+        """A list of SQL commands to execute, once per collection."""
+        update_summaries = """
+            SELECT dashboard.update_collection_default_summaries(%s);
+        """
+        return [update_summaries]
+
+    def _refresh(self, pool: ThreadedConnectionPool, collection: str) -> float:
+        """Refresh and commit one collection, returning its duration."""
+        conn = pool.getconn()
+        try:
+            start = time.perf_counter()
+            with conn.cursor() as cursor:
+                for command in self.sql_commands:
+                    cursor.execute(command, (collection,))
+            conn.commit()
+            return time.perf_counter() - start
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
+
+    def stale_collections(self, pool: ThreadedConnectionPool) -> List[str]:
+        """Return the ids of the collections to refresh."""
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(STALE_COLLECTIONS_SQL, {"force": self.force})
+                collections = [row[0] for row in cursor.fetchall()]
+            conn.commit()
+            return collections
+        finally:
+            pool.putconn(conn)
+
+    def execute(self):
+        """Refresh the stale collections concurrently."""
+        pool = ThreadedConnectionPool(
+            minconn=1,
+            maxconn=self.workers,
+            host=self.host,
+            port=self.port,
+            database=self.database,
+            user=self.user,
+            password=self.password,
+        )
+        start = time.perf_counter()
+        failed: List[Tuple[str, Exception]] = []
+        try:
+            collections = self.stale_collections(pool)
+            print(f"Refreshing {len(collections)} collection summaries...")
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {
+                    executor.submit(self._refresh, pool, collection): collection
+                    for collection in collections
+                }
+                for future in as_completed(futures):
+                    collection = futures[future]
+                    try:
+                        print(f"{collection}: refreshed in {future.result():.2f}s")
+                    except psycopg2.Error as e:
+                        print(f"{collection}: error refreshing summaries: {e}")
+                        failed.append((collection, e))
+        finally:
+            pool.closeall()
+
+        print(
+            f"Refreshed {len(collections) - len(failed)}/{len(collections)} "
+            f"collections in {time.perf_counter() - start:.2f}s"
+        )
+        if failed:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    CollectionSummariesRefresh.from_conn_string().execute()